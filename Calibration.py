@@ -0,0 +1,134 @@
+import numpy as np
+
+
+KELVIN = 273.15
+INVERSE_T_25C = 1 / (25 + KELVIN)
+
+#Every channel's calibration is compiled to a temperature table on this grid,
+#uniform in ln(R) from 10 ohm to 10 Mohm. Linear interpolation on it is good to
+#~1e-5 C for typical NTC thermistors.
+TABLE_POINTS = 4096
+LOG_R_MIN = np.log(10.)
+LOG_R_MAX = np.log(1E7)
+LOG_R_STEP = (LOG_R_MAX - LOG_R_MIN) / (TABLE_POINTS - 1)
+LOG_R_GRID = LOG_R_MIN + LOG_R_STEP * np.arange(TABLE_POINTS)
+
+MODELS = ("beta", "steinhart_hart", "table")
+
+
+'''Per-channel thermistor calibration of a Keithley. Each channel has a
+calibration model:
+    "beta": the two-parameter beta equation (resistance_25C, beta)
+    "steinhart_hart": 1/T = a + b ln(R) + c ln(R)^3 (sh_a, sh_b, sh_c)
+    "table": a manufacturer R-T table read from a CSV file with columns
+        resistance (ohm), temperature (C)
+Every model is compiled into a dense lookup table on a shared ln(R) grid, so
+a whole scan, or a whole (samples x channels) block of history, converts to
+temperature with one vectorized interpolation whatever the models are.'''
+class Calibration():
+
+    '''Constructor
+
+    Params:
+        num_channels: The number of channels on the instrument'''
+    def __init__(self, num_channels):
+        self.num_channels = num_channels
+        self.models = [None for i in range(num_channels)] #(model name, coefficients) per channel
+        self.offset = np.zeros(num_channels) #offsets of a few ohms due to cables etc
+        self.compiled = False
+
+    '''Reads and checks the calibration of one channel from its config
+    params, without changing anything.
+
+    Params:
+        params: The channel params. "model" selects the model (default
+            "beta"); the model's own params are listed in the class docstring.
+            "offset" is the constant cable resistance in series with the
+            thermistor (ohms, default 0).
+
+    Returns: the calibration, for set_channel()
+    Raises: ValueError if a param is missing or invalid, or the table
+        cannot be read'''
+    def parse_channel(self, params):
+        model = params.get("model", "beta")
+        try:
+            if model == "beta":
+                coefficients = (float(params["resistance_25c"]), float(params["beta"]))
+            elif model == "steinhart_hart":
+                coefficients = (float(params["sh_a"]), float(params["sh_b"]), float(params["sh_c"]))
+            elif model == "table":
+                table = np.loadtxt(params["table"], delimiter = ",", ndmin = 2)
+                order = np.argsort(table[:, 0])
+                coefficients = (np.log(table[order, 0]), table[order, 1])
+            else:
+                raise ValueError("Unrecognized calibration model: " + str(model))
+            offset = float(params.get("offset", 0))
+        except KeyError as e:
+            raise ValueError("Calibration model " + str(model) + " needs parameter " + str(e))
+        except (IOError, OSError, IndexError) as e:
+            raise ValueError("Unable to read calibration table: " + str(e))
+        return (model, coefficients), offset
+
+    '''Sets the calibration of one channel.
+
+    Params:
+        index: The array index of the channel
+        calibration: The calibration returned by parse_channel()'''
+    def set_channel(self, index, calibration):
+        self.models[index], self.offset[index] = calibration
+        self.compiled = False
+
+    '''Evaluates a calibration model.
+
+    Params:
+        model: (model name, coefficients) as stored by set_channel
+        log_resistances: Array of ln(R)
+
+    Returns: temperatures in degrees C, NaN where the model is undefined'''
+    @staticmethod
+    def model_temperatures(model, log_resistances):
+        name, coefficients = model
+        with np.errstate(divide = "ignore", invalid = "ignore"):
+            if name == "beta":
+                resistance_25C, beta = coefficients
+                inverse_t = INVERSE_T_25C + (log_resistances - np.log(resistance_25C)) / beta
+            elif name == "steinhart_hart":
+                a, b, c = coefficients
+                inverse_t = a + b*log_resistances + c*log_resistances**3
+            else: #table
+                table_log_resistances, table_temps = coefficients
+                return np.interp(log_resistances, table_log_resistances, table_temps, left = np.nan, right = np.nan)
+            return np.where(inverse_t > 0, 1 / inverse_t - KELVIN, np.nan)
+
+    '''Precomputes the lookup table of every configured channel'''
+    def compile(self):
+        self.table = np.full((self.num_channels, TABLE_POINTS), -np.inf)
+        for index, model in enumerate(self.models):
+            if model is not None:
+                temps = self.model_temperatures(model, LOG_R_GRID)
+                self.table[index] = np.where(np.isfinite(temps), temps, -np.inf)
+        self.compiled = True
+
+    '''Converts resistances to temperatures by interpolating the compiled
+    tables. Unconfigured channels, open circuits and resistances outside the
+    table give -inf.
+
+    Params:
+        resistances: Array whose last axis is the channel, e.g. one scan of
+            shape (num_channels,) or a block of shape (samples, num_channels)
+
+    Returns: temperatures in degrees C, same shape as resistances'''
+    def convert(self, resistances):
+        if not self.compiled:
+            self.compile()
+        resistances = np.asarray(resistances, dtype = float) - self.offset
+        with np.errstate(divide = "ignore", invalid = "ignore"):
+            position = (np.log(resistances) - LOG_R_MIN) / LOG_R_STEP
+        valid = np.isfinite(position) & (position >= 0) & (position <= TABLE_POINTS - 1)
+        position = np.where(valid, position, 0)
+        lower = np.minimum(position.astype(int), TABLE_POINTS - 2)
+        fraction = position - lower
+        channels = np.arange(self.num_channels) #broadcasts along the last axis
+        with np.errstate(invalid = "ignore"):
+            temps = self.table[channels, lower] * (1 - fraction) + self.table[channels, lower + 1] * fraction
+        return np.where(valid & np.isfinite(temps), temps, -np.inf)
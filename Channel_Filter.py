@@ -0,0 +1,137 @@
+import warnings
+import numpy as np
+from Ring_Buffer import Ring_Buffer
+
+
+FILTERS = ("none", "iir", "fir", "median")
+
+
+'''Per-channel digital filters for a Keithley's temperatures, so channels can
+be scanned fast at low NPLC and the noise averaged down in software. Each
+channel has a filter:
+    "none": the latest reading (default)
+    "iir": exponential smoothing, y += filter_alpha*(x - y)
+    "fir": weighted sum of the last readings with filter_taps (newest first),
+        or a moving average of the last filter_length readings
+    "median": moving median of the last filter_length readings
+Every scan is kept in a ring buffer of recent scans, and each filter type is
+evaluated for all of its channels at once. Channels not scanned on a tick
+are left out of their windows. A channel whose newest reading is invalid
+(open circuit) reads -inf and its filter starts over, so a dead sensor never
+shows its last good temperature as current.'''
+class Channel_Filter():
+
+    '''Constructor
+
+    Params:
+        num_channels: The number of channels on the instrument
+        depth: The number of recent scans kept, the longest FIR or median window'''
+    def __init__(self, num_channels, depth):
+        self.num_channels = num_channels
+        self.depth = depth
+        self.history = Ring_Buffer(depth, num_channels)
+        self.filters = [("none", None) for i in range(num_channels)] #(filter name, parameter) per channel
+        self.alpha = np.zeros(num_channels)
+        self.state = np.full(num_channels, np.nan) #IIR outputs, NaN until the first reading
+        self.compiled = False
+
+    '''Reads and checks the filter of one channel from its config params,
+    without changing anything.
+
+    Params:
+        params: The channel params: "filter" selects the filter (default
+            "none"); "filter_alpha", "filter_taps" and "filter_length" are
+            described in the class docstring.
+
+    Returns: the filter, for set_channel()
+    Raises: ValueError if a param is invalid'''
+    def parse_channel(self, params):
+        name = params.get("filter", "none")
+        if name == "iir":
+            parameter = float(params.get("filter_alpha", 0.2))
+            if not 0 < parameter <= 1:
+                raise ValueError("filter_alpha must be in (0, 1]")
+        elif name == "fir":
+            if "filter_taps" in params:
+                parameter = np.atleast_1d(np.asarray(params["filter_taps"], dtype=float))
+            else:
+                parameter = np.ones(int(params.get("filter_length", 5)))
+        elif name == "median":
+            parameter = int(params.get("filter_length", 5))
+        elif name == "none":
+            parameter = None
+        else:
+            raise ValueError("Unrecognized filter: " + str(name))
+        window = len(parameter) if name == "fir" else parameter
+        if name in ("fir", "median") and not 0 < window <= self.depth:
+            raise ValueError("Filter window must hold 1 to " + str(self.depth) + " scans")
+        return name, parameter
+
+    '''Sets the filter of one channel.
+
+    Params:
+        index: The array index of the channel
+        channel_filter: The filter returned by parse_channel()'''
+    def set_channel(self, index, channel_filter):
+        self.filters[index] = channel_filter
+        self.compiled = False
+
+    '''Groups the channels by filter into the arrays update() works on. IIR
+    channels whose alpha is unchanged (e.g. on a config refresh) keep their state.'''
+    def compile(self):
+        names = np.array([name for name, parameter in self.filters])
+        self.iir = names == "iir"
+        alpha = np.array([parameter if name == "iir" else 0 for name, parameter in self.filters])
+        self.state[~self.iir | (alpha != self.alpha)] = np.nan
+        self.alpha = alpha
+        self.fir = names == "fir"
+        fir_length = max([len(parameter) for name, parameter in self.filters if name == "fir"] or [0])
+        self.taps = np.zeros((fir_length, self.num_channels)) #newest scan first, zero for other channels
+        for index, (name, parameter) in enumerate(self.filters):
+            if name == "fir":
+                self.taps[:len(parameter), index] = parameter
+        self.median_groups = [] #(window length, indices of its channels)
+        lengths = [parameter for name, parameter in self.filters if name == "median"]
+        for length in sorted(set(lengths)):
+            members = [index for index, (name, parameter) in enumerate(self.filters) if name == "median" and parameter == length]
+            self.median_groups.append((length, np.array(members)))
+        self.compiled = True
+
+    '''Adds a scan and returns the filtered temperatures.
+
+    Params:
+        temps: The latest temperatures of all channels
+        fresh: Boolean array, which channels were measured in this scan
+
+    Returns: the filtered temperatures, -inf where a filter has no readings'''
+    def update(self, temps, fresh):
+        if not self.compiled:
+            self.compile()
+        row = np.where(fresh & np.isfinite(temps), temps, np.nan)
+        failed = fresh & ~np.isfinite(temps) #open circuit now: start over
+        if np.any(failed):
+            self.history.clear(failed)
+            self.state[failed] = np.nan
+        self.history.append(row)
+        filtered = np.array(temps, dtype=float)
+
+        measured = self.iir & ~np.isnan(row)
+        started = ~np.isnan(self.state)
+        self.state[measured & ~started] = row[measured & ~started]
+        both = measured & started
+        self.state[both] += self.alpha[both] * (row[both] - self.state[both])
+        filtered[self.iir] = self.state[self.iir]
+
+        if self.taps.shape[0]:
+            scans = self.history.latest(self.taps.shape[0])[::-1] #newest first
+            weights = np.where(np.isnan(scans), 0, self.taps[:len(scans)])
+            with np.errstate(invalid="ignore", divide="ignore"):
+                values = np.sum(weights * np.nan_to_num(scans), axis=0) / np.sum(weights, axis=0)
+            filtered[self.fir] = values[self.fir]
+
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning) #all-NaN windows
+            for length, members in self.median_groups:
+                filtered[members] = np.nanmedian(self.history.latest(length)[:, members], axis=0)
+        filtered[failed] = -np.inf
+        return np.where(np.isnan(filtered), -np.inf, filtered)
@@ -0,0 +1,80 @@
+import numpy as np
+
+
+#Number of switching channels (measurement channels, not counting current or
+#digital channels) on each Keithley plug-in card model
+CARD_CHANNELS = {
+    7700: 20,
+    7702: 40,
+    7706: 20,
+    7708: 40,
+    7710: 20,
+}
+
+#Number of card slots in each DMM model
+INSTRUMENT_SLOTS = {
+    2700: 2,
+    2701: 2,
+    2750: 5,
+}
+
+DEFAULT_CARDS = [7706, 7706] #the original two 20-channel cards, channels 101-120 and 201-220
+
+
+'''Map between a DMM's channel numbers (slot*100 + channel, e.g. 101 or 219)
+and the array index of the channel in its readings. Built once per device
+from the instrument model and card layout; every lookup is then an array
+access, and many channels can be looked up at once.'''
+class Channel_Map():
+
+    '''Constructor
+
+    Params:
+        cards: List with one entry per slot, starting at slot 1: a card model
+            from CARD_CHANNELS, or a channel count for other cards, or 0 for
+            an empty slot. A single entry may be given without a list.
+        instrument: DMM model, used to check the number of slots'''
+    def __init__(self, cards = None, instrument = 2701):
+        if cards is None:
+            cards = DEFAULT_CARDS
+        if not isinstance(cards, list):
+            cards = [cards]
+        slots = INSTRUMENT_SLOTS.get(instrument)
+        if slots is not None and len(cards) > slots:
+            raise ValueError("ERROR: Keithley " + str(instrument) + " has only " + str(slots) + " slots")
+        channel_numbers = []
+        for slot, card in enumerate(cards):
+            count = CARD_CHANNELS.get(card, card)
+            if not isinstance(count, int) or not 0 <= count < 100:
+                raise ValueError("ERROR: Invalid card in slot " + str(slot + 1) + ": " + str(card))
+            channel_numbers.extend(100*(slot + 1) + np.arange(1, count + 1))
+        self.channel_numbers = np.array(channel_numbers, dtype=int) #index -> channel number
+        self.num_channels = len(self.channel_numbers)
+        self.index_of = np.full(100*(len(cards) + 1), -1, dtype=int) #channel number -> index, -1 if none
+        self.index_of[self.channel_numbers] = np.arange(self.num_channels)
+
+    '''Converts a channel number into its array index'''
+    def index(self, channel_number):
+        channel = int(channel_number)
+        if channel != channel_number or not 0 <= channel < len(self.index_of) or self.index_of[channel] < 0:
+            raise ValueError("ERROR: Invalid channel number " + str(channel_number))
+        return int(self.index_of[channel])
+
+    '''Converts many channel numbers into an array of array indices at once'''
+    def indices(self, channel_numbers):
+        channels = np.atleast_1d(np.asarray(channel_numbers))
+        valid = (channels == np.round(channels)) & (channels >= 0) & (channels < len(self.index_of))
+        indices = np.where(valid, self.index_of[np.where(valid, channels, 0).astype(int)], -1)
+        if np.any(indices < 0):
+            raise ValueError("ERROR: Invalid channel numbers " + str(channels[indices < 0].tolist()))
+        return indices
+
+    '''Converts an array index into its channel number'''
+    def channel(self, index):
+        if not 0 <= index < self.num_channels:
+            raise ValueError("ERROR: Invalid array index " + str(index))
+        return int(self.channel_numbers[index])
+
+    '''Converts an array of array indices into channel numbers at once'''
+    def channels(self, indices):
+        return self.channel_numbers[indices]
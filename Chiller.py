@@ -1,10 +1,7 @@
 import serial
-from Tools import Tools
-import os
-import json
 import Constants
-
-DIRECTORY = os.getcwd() #We want to save our current directory!
+import Clock
+from Device_Log import Device_Log
 
 
 '''Class representing and communicating with a chiller.'''
@@ -14,22 +11,22 @@ class Chiller():
 
     Params:
         name: The name of the chiller
-        params: Dictionary of parameters passed from parsing config file. Must include "address" for serial port'''
+        params: Dictionary of parameters passed from parsing config file. Must include "address" for serial port.
+            "log_format" and "log_pyramid" set up logging, see Device_Log'''
     def __init__(self, name, params):
 
         self.type = "chiller"
         self.name = name
         port = params["address"].replace("usb", "USB")
         try:
-            self.serial = serial.Serial(port, timeout = .1,
-                                        baudrate = 19200)  # open serial port
+            self.serial = serial.Serial(port, timeout = .1, write_timeout = Constants.Constants.CONNECT_TIMEOUT,
+                                        baudrate = 19200)  # open serial port, writes and the handshake bounded too
             self.serial.reset_input_buffer()
             self.serial.reset_output_buffer()
         except serial.SerialException as e:
             print("ERROR unable to connect to chiller " + name)
             raise e
-        self.current_modified_julian_date = int(Tools.get_modified_julian_date())
-        self.create_log_file()
+        self.device_log = Device_Log(self.name, self.type, params)
         self.setpoint_min = Constants.Constants.CHILLER_MIN #degrees C
         self.setpoint_max = Constants.Constants.CHILLER_MAX
         self.setpoint = Constants.Constants.DEFAULT_CHILLER_SETPOINT #starting value, near room temp
@@ -37,18 +34,6 @@ class Chiller():
         self.turn_on()
         print("Device initialized: " + name)
 
-    '''Creates log file for the device'''
-    def create_log_file(self):
-        log_file_directory = DIRECTORY+"/Logging/"+self.name.replace(" ","")
-        try:
-            os.mkdir(log_file_directory)
-        except OSError: #directory already exists
-            pass
-        self.log_file = log_file_directory + "/" + str(self.current_modified_julian_date) + ".txt"
-        with open(self.log_file, "a"):
-            pass #Just create the file
-        print("Created log file for device " + self.name)
-
     '''Writes a command using a handshake protocol.
     Params:
         command: The command to write
@@ -128,10 +113,5 @@ class Chiller():
 
     '''Logs the setpoint and current water temperature in the chiller.'''
     def log(self):
-        if not int(Tools.get_modified_julian_date()) == self.current_modified_julian_date:
-            #we crossed midnight
-            self.current_modified_julian_date = int(Tools.get_modified_julian_date())
-            self.create_log_file()
         water_temp = float(self.get_water_temp())
-        with open(self.log_file, "a") as f:
-            f.write(json.dumps([Tools.get_modified_julian_date(), [float(self.setpoint), water_temp]])+"\n")
+        self.device_log.write(Clock.CLOCK.tick_mjd, [float(self.setpoint), water_temp], ["setpoint", "water_temp"])
@@ -0,0 +1,73 @@
+import calendar
+import time
+
+try:
+    monotonic = time.monotonic
+except AttributeError: #Python 2
+    monotonic = time.time
+
+MJD_UNIX_EPOCH = 40587.0 #MJD of 1970-01-01 00:00
+SECONDS_PER_DAY = 86400.0
+REANCHOR_TOLERANCE = 1.0 #Re-anchor when wall clock and monotonic clock disagree by this much (sec)
+RECHECK_INTERVAL = 1.0 #How often now() compares the monotonic clock with the wall clock (sec)
+
+
+'''Returns the offset of local time from UTC (sec) at Unix time t'''
+def utc_offset(t):
+    return calendar.timegm(time.localtime(t)) - int(t)
+
+
+'''Converts a Unix time (e.g. from time.time()) to the local-time MJD used
+by Clock'''
+def unix_to_mjd(t):
+    return MJD_UNIX_EPOCH + (t + utc_offset(t)) / SECONDS_PER_DAY
+
+
+'''Shared clock giving the modified Julian date without astropy. Like the
+astropy.time.Time(datetime.now()) it replaces, the MJD is of the local wall
+clock time. The MJD is computed arithmetically from an anchor on the
+monotonic clock and checked against the wall clock at most once per
+RECHECK_INTERVAL, so every process stays on the wall clock whether or not it
+ticks. tick() takes one timestamp per control loop tick that every device
+logs with.'''
+class Clock():
+
+    def __init__(self):
+        self.anchor()
+
+    '''Ties the monotonic clock to the current local wall clock time'''
+    def anchor(self):
+        wall_time = time.time()
+        self.anchor_monotonic = monotonic()
+        self.anchor_mjd = unix_to_mjd(wall_time)
+        self.checked_monotonic = self.anchor_monotonic
+        self.tick_mjd = self.anchor_mjd
+
+    '''Returns the current MJD. Re-anchors if the wall clock was stepped
+    (NTP, daylight saving time) since the last check.'''
+    def now(self):
+        current = monotonic()
+        mjd = self.anchor_mjd + (current - self.anchor_monotonic) / SECONDS_PER_DAY
+        if current - self.checked_monotonic >= RECHECK_INTERVAL or current < self.checked_monotonic:
+            self.checked_monotonic = current
+            if abs(unix_to_mjd(time.time()) - mjd) * SECONDS_PER_DAY > REANCHOR_TOLERANCE:
+                self.anchor()
+                mjd = self.anchor_mjd
+        return mjd
+
+    '''Takes the timestamp of a new tick, shared by all devices as tick_mjd.
+
+    Returns: the MJD of the tick'''
+    def tick(self):
+        self.tick_mjd = self.now()
+        return self.tick_mjd
+
+    '''Converts an MJD from this clock to an astropy Time, for when full
+    astropy time handling is needed. Imports astropy only when called.'''
+    @staticmethod
+    def to_astropy_time(mjd):
+        import astropy.time
+        return astropy.time.Time(mjd, format = "mjd")
+
+
+CLOCK = Clock() #The clock shared by the whole process
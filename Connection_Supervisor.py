@@ -0,0 +1,44 @@
+import threading
+import time
+import socket
+import Constants
+
+
+'''Background thread that re-establishes a lost instrument connection. The
+device reports a lost connection with report_lost() and carries on serving
+cached data; this thread retries the device's connect function with
+exponential backoff, so the control loop never stalls on a dead instrument.'''
+class Connection_Supervisor(threading.Thread):
+
+    '''Params:
+        device_name: The name of the supervised device, for messages
+        connect: Function that opens the connection, raising socket.error
+            (or ValueError) on failure'''
+    def __init__(self, device_name, connect):
+        threading.Thread.__init__(self) #Must call this for the thread to be set up correctly
+        self.device_name = device_name
+        self.connect = connect
+        self.lost_flag = threading.Event()
+        self.daemon = True #it will kill automatically, don't have to worry about zombies
+
+    '''Asks the supervisor to reconnect. Returns immediately.'''
+    def report_lost(self):
+        self.lost_flag.set()
+
+    '''Run method for the thread. Sleeps until a connection is reported lost,
+    then retries with delays doubling from RECONNECT_MIN_DELAY up to
+    RECONNECT_MAX_DELAY until it succeeds.'''
+    def run(self):
+        while True:
+            self.lost_flag.wait()
+            self.lost_flag.clear() #before connecting, so a loss reported by the new connection is not missed
+            delay = Constants.Constants.RECONNECT_MIN_DELAY
+            while True:
+                try:
+                    self.connect()
+                    break
+                except (socket.error, ValueError) as e:
+                    print("ERROR reconnecting to " + self.device_name + ": " + str(e) + ", retrying in " + str(delay) + " s")
+                    time.sleep(delay)
+                    delay = min(2*delay, Constants.Constants.RECONNECT_MAX_DELAY)
+            print("Reconnected to " + self.device_name)
@@ -7,6 +7,25 @@ class Constants:
     #Constants
     BASE_TICK_INTERVAL = 30  #how often clock ticks to update servos (sec)
     LOGGING_INTERVAL = 30  #How often to log (sec)
+    ACQUISITION_TIMEOUT = 25 #How long a tick waits for all Keithleys to finish reading (sec)
+    SCPI_TIMEOUT = 20 #How long to wait for a complete response from a SCPI instrument (sec)
+    STALE_DRAIN_TIMEOUT = 0.5 #How long to wait for the rest of a timed-out response before requerying (sec)
+    CONNECT_TIMEOUT = 5 #How long to wait when opening an instrument connection (sec)
+    DEVICE_STARTUP_TIMEOUT = 30 #How long startup waits for all devices to come up (sec)
+    RECONNECT_MIN_DELAY = 1 #First retry delay after a lost connection (sec), doubles each try
+    RECONNECT_MAX_DELAY = 60 #Longest retry delay after a lost connection (sec)
+    MAX_FAILED_READS = 3 #Consecutive failed reads before a connection is treated as lost
+    MAX_READING_AGE = 120 #Servos hold their output if their input reading is older than this (sec)
+    STREAM_BLOCK_SCANS = 5 #Scans per trace buffer drain in streaming mode
+    STREAM_BUFFER_DEPTH = 1000 #Scans kept in memory per Keithley in streaming mode
+    STREAM_POLL_INTERVAL = 0.5 #How often the trace buffer is polled in streaming mode (sec)
+    LOG_QUEUE_SIZE = 10000 #Log entries waiting for the log writer thread before new ones are dropped
+    LOG_FLUSH_INTERVAL = 0 #Flush log files at most this often (sec), 0 after every batch of entries
+    LOG_FSYNC = False #Also fsync log files on every flush (slower, but survives a power cut)
+    ARCHIVE_AFTER_DAYS = 7 #Compress log day files this many days old, 0 to never compress
+    ARCHIVE_INTERVAL = 3600 #How often to look for log day files to compress (sec)
+    ARCHIVE_FRAME_SIZE = 262144 #Uncompressed bytes per independently readable frame of a compressed day file
+    FILTER_HISTORY_DEPTH = 100 #Scans kept per Keithley for digital filtering, the longest filter window
     MAX_TRIALS_CHILLER = 5 #How many tries to communicate with chiller before giving up
     DEFAULT_CHILLER_SETPOINT = 21
     CHILLER_MAX = 50 #Maximum allowed setpoint, default
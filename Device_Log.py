@@ -0,0 +1,123 @@
+import json
+import os
+import Log_Format
+import Log_Writer
+from Log_Pyramid import Log_Pyramid
+
+
+DIRECTORY = os.getcwd() #We want to save our current directory!
+
+LOG_FORMATS = ("json", "binary")
+
+
+'''Day files of one device, Logging/<device>/<mjd>.txt (JSON) or .bin
+(binary, see Log_Format). Shared by all the drivers that log. Entries are
+handed to the Log_Writer thread, which keeps the day file open and starts a
+new one when an entry's MJD crosses midnight; only that thread touches the
+file. Every entry also updates the device's Log_Pyramid, unless disabled.'''
+class Device_Log():
+
+    '''Constructor
+
+    Params:
+        device_name: The name of the device
+        device_type: The device type, recorded in binary headers
+        params: The device params. "log_format" is "json" (default) or
+            "binary"; "log_pyramid" 0 turns off the downsampled pyramid.'''
+    def __init__(self, device_name, device_type, params):
+        log_format = params.get("log_format", "json")
+        if log_format not in LOG_FORMATS:
+            raise ValueError("Unrecognized log format: " + str(log_format))
+        self.device_name = device_name
+        self.device_type = device_type
+        self.log_format = log_format
+        self.directory = DIRECTORY+"/Logging/"+device_name.replace(" ","")
+        try:
+            os.mkdir(self.directory)
+        except OSError: #directory already exists
+            pass
+        self.day = None #MJD of the current file
+        self.path = None
+        self.file = None #open day file, owned by the Log_Writer thread
+        self.pyramid_enabled = bool(params.get("log_pyramid", 1))
+        self.pyramid = None #Log_Pyramid, opened with the first entries
+
+    '''Queues one entry for the Log_Writer thread. Returns immediately.
+
+    Params:
+        mjd: The time of the entry
+        values: List of floats
+        columns: Names of the values, for the binary header'''
+    def write(self, mjd, values, columns):
+        Log_Writer.WRITER.submit(self, mjd, list(values), columns)
+
+    '''Encodes one entry in the log format'''
+    def encode(self, mjd, values):
+        if self.log_format == "binary":
+            return Log_Format.pack_row([mjd] + values)
+        return (json.dumps([mjd, values])+"\n").encode("utf-8")
+
+    '''Appends entries with one write per day file. Called by the Log_Writer
+    thread only.
+
+    Params:
+        rows: List of (mjd, values, columns) in time order'''
+    def write_rows(self, rows):
+        chunk = []
+        for mjd, values, columns in rows:
+            if int(mjd) != self.day: #we've crossed midnight
+                if chunk:
+                    self.file.write(b"".join(chunk))
+                    chunk = []
+                self.start_day(int(mjd), columns)
+            chunk.append(self.encode(mjd, values))
+        self.file.write(b"".join(chunk))
+        if self.pyramid_enabled:
+            columns = list(rows[-1][2])
+            if self.pyramid is None or self.pyramid.columns != columns:
+                if self.pyramid is not None:
+                    self.pyramid.close()
+                self.pyramid = Log_Pyramid(self.directory, self.device_name, self.device_type, columns)
+            self.pyramid.add([row[0] for row in rows], [row[1] for row in rows])
+
+    '''Flushes the day file to the OS, and to disk if fsync is set'''
+    def flush(self, fsync = False):
+        if self.file is not None:
+            self.file.flush()
+            if fsync:
+                os.fsync(self.file.fileno())
+        if self.pyramid is not None:
+            self.pyramid.flush(fsync)
+
+    '''Flushes and closes the day file and the pyramid'''
+    def close(self):
+        self.close_day()
+        if self.pyramid is not None:
+            self.pyramid.close()
+            self.pyramid = None
+
+    '''Flushes and closes the day file'''
+    def close_day(self):
+        if self.file is not None:
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.file.close()
+            self.file = None
+            self.day = None
+
+    '''Closes the previous day file and opens (or continues) the file of a
+    day. A binary file is created with its header first, see
+    Log_Format.create_binary; an existing file loses any row left incomplete
+    by a crash before new rows are appended.'''
+    def start_day(self, day, columns):
+        self.close_day()
+        if self.log_format == "json":
+            self.path = self.directory + "/" + str(day) + Log_Format.JSON_EXTENSION
+        else:
+            self.path = self.directory + "/" + str(day) + Log_Format.BINARY_EXTENSION
+            Log_Format.create_binary(self.path, self.device_name, self.device_type, ["mjd"] + list(columns))
+        if os.path.exists(self.path):
+            Log_Format.truncate_partial(self.path)
+        self.file = open(self.path, "ab")
+        self.day = day
+        print("Created log file for device " + self.device_name)
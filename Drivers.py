@@ -0,0 +1,30 @@
+import importlib
+
+
+#Device "type" in the config file -> (module, class) of its driver. Drivers
+#are only imported when a config file instantiates them, so e.g. pyserial is
+#not loaded unless there is a chiller.
+DRIVERS = {
+    "keithley": ("Keithley_DMM", "Keithley_DMM"),
+    "chiller": ("Chiller", "Chiller"),
+    "rigol_dp832a": ("rigol_dp832a", "rigol_dp832a"),
+}
+
+
+'''Registers a driver class for a device type.
+
+Params:
+    device_type: The "type" string used in the config file
+    module_name: The module holding the driver
+    class_name: The driver class, constructed as class_name(name, params)'''
+def register_driver(device_type, module_name, class_name):
+    DRIVERS[device_type] = (module_name, class_name)
+
+
+'''Returns the driver class for a device type, importing its module on first
+use. Raises ValueError for an unregistered type.'''
+def get_driver(device_type):
+    if device_type not in DRIVERS:
+        raise ValueError("Unrecognized device type: " + str(device_type))
+    module_name, class_name = DRIVERS[device_type]
+    return getattr(importlib.import_module(module_name), class_name)
@@ -4,6 +4,7 @@ import socket
 import time, datetime
 import os
 import numpy as np
+from Scpi_Reader import Scpi_Reader
 
 class keithley():
 #Initialization. 
@@ -50,10 +51,8 @@ class keithley():
 		s.send("ROUT:SCAN (@101:120) \n") #Sets scan route 1 to 20 here
 		s.send("ROUT:SCAN:TSO IMM \n")
 		s.send("ROUT:SCAN:LSEL INT \n")
-		s.send("READ? \n")
-
 		#time.sleep(.1)
-		data = str(s.recv(self.buffer_size))
+		data = Scpi_Reader(s, self.buffer_size).query("READ? \n").decode("ascii")
 		data = data.split(',')
 
 		#Keithley returns a lot of other stuff currently, this ignores the returns we dont use and processes the ones we do
@@ -91,10 +90,8 @@ class keithley():
 		s.send("ROUT:SCAN (@201:220) \n") #Sets scan route 1 to 20 here
 		s.send("ROUT:SCAN:TSO IMM \n")
 		s.send("ROUT:SCAN:LSEL INT \n")
-		s.send("READ? \n")
-
 		#time.sleep(.1)
-		data = str(s.recv(self.buffer_size)) #TODO figure out why receiving empty string
+		data = Scpi_Reader(s, self.buffer_size).query("READ? \n").decode("ascii")
 		data = data.split(',')
 
                 
@@ -136,10 +133,8 @@ class keithley():
 		s.send("ROUT:SCAN (@101:120) \n") #Sets scan route 1 to 20 here
 		s.send("ROUT:SCAN:TSO IMM \n")
 		s.send("ROUT:SCAN:LSEL INT \n")
-		s.send("READ? \n")
-
 		#time.sleep(.1)
-		data = str(s.recv(self.buffer_size))
+		data = Scpi_Reader(s, self.buffer_size).query("READ? \n").decode("ascii")
 		data = data.split(',')
 
 		#Keithley returns a lot of other stuff currently, this ignores the returns we dont use and processes the ones we do
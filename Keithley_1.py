@@ -4,6 +4,7 @@
 
 import socket
 import numpy as np
+from Scpi_Reader import Scpi_Reader
 
 try: #Optimize range function for Python 2, 3
     range = xrange
@@ -61,9 +62,7 @@ class keithley():
         
         sock.send("ROUT:SCAN:TSO IMM \n")
         sock.send("ROUT:SCAN:LSEL INT \n")
-        sock.send("READ? \n")
-        
-        data = str(sock.recv(self.buffer_size)).split(',')
+        data = Scpi_Reader(sock, self.buffer_size).query("READ? \n").decode("ascii").split(',')
         print("data", data)
         resistances = []
         if not data:
@@ -1,11 +1,20 @@
 import numpy as np
 import socket
-from Tools import Tools
-import os
-import json
+import time
+from Scpi_Reader import Scpi_Reader
+from Ring_Buffer import Ring_Buffer
+from Keithley_Stream import Keithley_Stream
+from Connection_Supervisor import Connection_Supervisor
+from Calibration import Calibration
+from Channel_Map import Channel_Map
+from Channel_Filter import Channel_Filter
+from Device_Log import Device_Log
+import Constants
+import Clock
+import re
 
 
-DIRECTORY = os.getcwd() #We want to save our current directory!
+UNIT_SUFFIX = re.compile(r"[A-Z#]+(?=,|$)") #"OHM", "SECS", "RDNG#" after each field
 
 
 
@@ -14,8 +23,6 @@ class Keithley_DMM():
 
     #This is extended and modified from the old keithley class in Keithley.py
 
-    NUM_CHANNELS = 40
-
     '''Initializes the Keithley.
     Params:
         name: A unique name identifying the Keithley
@@ -27,42 +34,133 @@ class Keithley_DMM():
     Required channel params (when configuring channels):
         "resistance_25C": Resistance of thermistor at 25C
         "beta": Thermistor beta coefficient
+        (or, with "model" = "steinhart_hart" or "table", the params of that
+        calibration model, see Calibration)
+
+    Optional params:
+        "port": TCP port (default 1394, the 2701 port)
+        "instrument": DMM model number (default 2701)
+        "cards": Card in each slot, as a card model or channel count, e.g.
+            [7706, 7706] (default, channels 101-120 and 201-220) or 7708 for
+            a single 40-channel card. See Channel_Map.
+        "data_format": "ascii" (default) or "real". With "real" readings are
+            transferred as binary float64 values (FORM:DATA DREAL), which is
+            several times smaller and is decoded without a Python loop.
+        "acquisition": "blocking" (default), "pipelined" or "streaming".
+            In pipelined mode each read() fetches the scan started by the
+            previous read() (FETC?) and immediately starts the next one (INIT),
+            so the instrument integrates while the servos, logging and other
+            devices are busy. Readings are then one tick old.
+            In streaming mode the instrument scans all configured channels
+            continuously into its trace buffer, a background thread drains it
+            in bulk (TRAC:DATA?) into a ring buffer, and read() only averages
+            the newest scans from memory.
+        "stream_block": Streaming mode: scans per trace buffer drain (default
+            Constants.STREAM_BLOCK_SCANS)
+        "stream_average": Streaming mode: number of newest scans read()
+            averages (default 1, i.e. the most recent scan)
+        "requery_missing": If 1, channels missing from a truncated response
+            are read again right away with a READ? of just those channels.
+            Otherwise (default 0) they keep their previous readings, which
+            age until the next scan.
+        "log_format": "json" (default) or "binary", see Log_Format
+        "log_pyramid": 0 to not keep the downsampled log, see Log_Pyramid
 
     Optional channel params:
         "offset": A constant resistance offset due to cables, etc.
+        "model": Calibration model: "beta" (default), "steinhart_hart" or "table"
+        "filter": Digital filter: "none" (default), "iir", "fir" or "median",
+            with "filter_alpha", "filter_taps" or "filter_length" (see
+            Channel_Filter). Servos and logs use the filtered temperatures.
+        "nplc": Integration time in power line cycles (default 1)
+        "scan_every": Scan this channel only every n ticks (default 1). The
+            channels sharing a rate are spread round-robin over the ticks.
+            Servo inputs (see set_servo_input) are always scanned every tick.
 '''
     def __init__(self, name, params):
-        self.port = 1394 #2701 port
+        self.port = int(params.get("port", 1394)) #2701 port
         self.buffer_size=2048
         print(params)
         self.ip_address = params["address"]
         self.name = name
         self.type = "keithley"
-        self.resistance_25C = np.full(self.NUM_CHANNELS, np.inf) #resistances of thermistors at 25C
-        self.beta = np.zeros(self.NUM_CHANNELS) #beta for each thermistor
-        self.resistances = np.full(self.NUM_CHANNELS, np.inf) #actual resistances stored in memory
-        self.temps = np.full(self.NUM_CHANNELS, -np.inf) #actual temps stored in memo
-        self.offset = np.zeros(self.NUM_CHANNELS) #offsets of a few ohms due to cables etc
-        self.channel_names = ["" for i in range(40)] #channel names
-        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.sock.connect((self.ip_address, self.port))
-        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
-        self.current_modified_julian_date = int(Tools.get_modified_julian_date())
-        log_file_directory = DIRECTORY+"/"+self.name.replace(" ", "")
-        self.create_log_file()
+        self.data_format = params.get("data_format", "ascii")
+        if self.data_format not in ("ascii", "real"):
+            raise ValueError("Unrecognized Keithley data format: " + str(self.data_format))
+        self.acquisition = params.get("acquisition", "blocking")
+        if self.acquisition not in ("blocking", "pipelined", "streaming"):
+            raise ValueError("Unrecognized Keithley acquisition mode: " + str(self.acquisition))
+        self.pending_scan = None #channels of the scan started with INIT but not yet fetched
+        self.channel_map = Channel_Map(params.get("cards"), params.get("instrument", 2701))
+        self.num_channels = self.channel_map.num_channels
+        self.stream_block = int(params.get("stream_block", Constants.Constants.STREAM_BLOCK_SCANS))
+        self.stream_average = int(params.get("stream_average", 1))
+        self.requery_missing = bool(params.get("requery_missing", 0))
+        self.stream_channels = () #channels in the trace buffer block being acquired
+        self.stream_buffer = Ring_Buffer(Constants.Constants.STREAM_BUFFER_DEPTH, self.num_channels)
+        self.stream = None #Keithley_Stream thread, streaming mode only
+        self.calibration = Calibration(self.num_channels) #per-channel thermistor coefficients and offsets
+        self.resistances = np.full(self.num_channels, np.inf) #actual resistances stored in memory
+        self.temps = np.full(self.num_channels, -np.inf) #filtered temps, what servos and logs use
+        self.raw_temps = np.full(self.num_channels, -np.inf) #unfiltered temps of the latest readings
+        self.filter = Channel_Filter(self.num_channels, Constants.Constants.FILTER_HISTORY_DEPTH)
+        self.reading_times = np.full(self.num_channels, -np.inf) #when each channel was last sampled, by the instrument's timestamps (Unix time)
+        self.logged_reading_time = -np.inf #newest reading time already logged, see log()
+        self.scan_started = None #time.time() when the scan being read was triggered
+        self.channel_names = ["" for i in range(self.num_channels)] #channel names
+        self.configured = np.zeros(self.num_channels, dtype=bool) #channels registered through configure_channel
+        self.nplc = np.ones(self.num_channels) #integration time of each channel
+        self.scan_every = np.ones(self.num_channels, dtype=int) #scan each channel every n ticks
+        self.servo_input = np.zeros(self.num_channels, dtype=bool) #channels feeding a servo
+        self.tick_count = 0 #number of scans scheduled so far
+        self.session_configured = False #whether measurement settings have been pushed to the instrument
+        self.scan_route = None #tuple of channel numbers currently programmed on the instrument
+        self.connected = False
+        self.failed_reads = 0 #consecutive reads that failed
+        self.next_reading_number = None #reading number the next response should start at, None if unknown
+        self.connect()
+        self.configure_session(self.sock)
+        self.supervisor = Connection_Supervisor(self.name, self.connect)
+        self.supervisor.start()
+        if self.acquisition == "streaming":
+            self.stream = Keithley_Stream(self)
+            self.stream.start()
+        self.device_log = Device_Log(self.name, self.type, params)
         print("Device initialized: " + name)
 
-    '''Creates log file for the Keithley'''
-    def create_log_file(self):
-        log_file_directory = DIRECTORY+"/Logging/"+self.name.replace(" ","")
+    '''Opens the socket to the Keithley. The scan session is pushed again on
+    the next read, since the instrument may have been power cycled.'''
+    def connect(self):
+        sock = socket.create_connection((self.ip_address, self.port), Constants.Constants.CONNECT_TIMEOUT)
+        sock.settimeout(None)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.sock = sock
+        self.reader = Scpi_Reader(self.sock, self.buffer_size, Constants.Constants.SCPI_TIMEOUT)
+        self.session_configured = False
+        self.pending_scan = None
+        self.failed_reads = 0
+        self.next_reading_number = None
+        self.connected = True
+
+    '''Marks the connection as lost and hands reconnection to the supervisor.
+    Until it succeeds, reads return the cached readings, whose age grows.'''
+    def connection_lost(self, error):
+        if not self.connected:
+            return
+        self.connected = False
+        print("ERROR: lost connection to " + self.name + ": " + str(error))
         try:
-            os.mkdir(log_file_directory)
-        except OSError: #directory already exists
+            self.sock.close()
+        except socket.error:
             pass
-        self.log_file = log_file_directory + "/" + str(self.current_modified_julian_date) + ".txt"
-        with open(self.log_file, "a"):
-            pass #Just create the file
-        print("Created log file for device " + self.name)
+        self.supervisor.report_lost()
+
+    '''Counts a read that failed without a socket error. After
+    MAX_FAILED_READS in a row the link is probably dead, and is treated as lost.'''
+    def read_failed(self, error):
+        self.failed_reads += 1
+        if self.failed_reads >= Constants.Constants.MAX_FAILED_READS:
+            self.connection_lost(error)
 
     '''Reads resistance from a specific channel on the Keithley. Adjusts
     for calibration and converts to temperature.
@@ -71,86 +169,454 @@ class Keithley_DMM():
     Returns: The temperature in degrees celcius
         '''
     def read(self):
+        previous_times = self.reading_times.copy()
         self.resistances = self.read_resistances()
-        self.temps = Tools.resistance_to_temp_array(self.resistances, self.resistance_25C, self.beta)
+        self.raw_temps = self.calibration.convert(self.resistances)
+        self.temps = self.filter.update(self.raw_temps, self.reading_times != previous_times)
 
     '''Gets the resistance for a given channel'''
     def get_resistance(self, channel):
-        return self.resistances[Tools.channel_number_to_array_index(channel)]
+        return self.resistances[self.channel_map.index(channel)]
+
+    '''Gets the age (sec) of the latest reading of a given channel. Infinite if
+    the channel has never been read.'''
+    def get_age(self, channel):
+        return time.time() - self.reading_times[self.channel_map.index(channel)]
+
+    '''Gets the sample times (Unix time) of many channels at once, from an
+    index array made by channel_indices'''
+    def get_sample_times(self, indices):
+        return self.reading_times[indices]
 
     '''Gets the temp for a given channel'''
     def get_temp(self, channel):
-        return self.temps[Tools.channel_number_to_array_index(channel)]
+        return self.temps[self.channel_map.index(channel)]
+
+    '''Converts channel numbers to an index array, to be computed once and
+    then passed to get_temps and get_ages on every tick'''
+    def channel_indices(self, channels):
+        return self.channel_map.indices(channels)
+
+    '''Gets the temps of many channels at once, from an index array made by
+    channel_indices'''
+    def get_temps(self, indices):
+        return self.temps[indices]
+
+    '''Gets the time since the last reading (sec) of many channels at once,
+    from an index array made by channel_indices'''
+    def get_ages(self, indices):
+        return time.time() - self.reading_times[indices]
+
+    '''Returns the indices of the channels registered through configure_channel,
+    or of every channel if none have been configured yet.'''
+    def configured_indices(self):
+        indices = np.flatnonzero(self.configured)
+        if len(indices) == 0:
+            indices = np.arange(self.num_channels)
+        return indices
 
-    '''Reads resistances from the Keithley.
-    Returns: A length-40 numpy array containing the resistances of all channels.'''
+    '''Returns the channel numbers due to be scanned on this tick. Servo inputs
+    are scanned every tick; a channel with scan_every = n is scanned every n
+    ticks, with the channels sharing a rate staggered so each tick scans about
+    the same number of them.'''
+    def scheduled_channels(self):
+        indices = self.configured_indices()
+        period = np.where(self.servo_input[indices], 1, self.scan_every[indices])
+        phase = np.zeros(len(indices), dtype=int)
+        for rate in np.unique(period):
+            members = period == rate
+            phase[members] = np.arange(np.count_nonzero(members)) % rate
+        due = indices[(self.tick_count + phase) % period == 0]
+        return tuple(self.channel_map.channels(due).tolist())
+
+    '''Marks a channel, or a list of channels, as servo inputs, so they are
+    scanned on every tick'''
+    def set_servo_input(self, channel_number):
+        self.servo_input[self.channel_indices(channel_number)] = True
+
+    '''Clears all servo input flags, before the servos mark theirs again'''
+    def clear_servo_inputs(self):
+        self.servo_input[:] = False
+
+    '''Reads resistances from the Keithley. Only the channels due on this tick
+    are scanned; their readings are scattered back into the full array and the
+    other channels keep their previous readings.
+    Returns: A numpy array containing the resistances of all channels.'''
     def read_resistances(self):
+        if self.acquisition == "streaming":
+            values = self.stream_buffer.mean(self.stream_average)
+            return np.where(np.isnan(values), self.resistances, values)
+        if not self.connected: #the supervisor is reconnecting
+            return self.resistances
+        channels = self.scheduled_channels()
+        self.tick_count += 1
         try:
-            return np.array(self.read_data_from_card(self.sock, 101, 220))
+            if self.acquisition == "pipelined":
+                scanned, self.pending_scan = self.pending_scan, None
+                values = self.fetch_data_from_card(self.sock, scanned) if scanned else None
+                values = self.complete_scan(scanned, values)
+                if channels:
+                    self.start_scan(self.sock, channels)
+            else:
+                scanned = channels
+                values = self.read_data_from_card(self.sock, channels) if channels else None
+                values = self.complete_scan(scanned, values)
+        except socket.error as e:
+            self.connection_lost(e)
+            return self.resistances
         except ValueError as e:
             print(e.message + " (If occasional, ignore this error)")
             print("Using cached resistances")
+            self.read_failed(e)
             return self.resistances
+        self.failed_reads = 0
+        if values is None: #nothing was scanned
+            return self.resistances
+        indices = self.channel_map.indices(scanned[:len(values)]) #a truncated scan updates only what arrived
+        resistances = self.resistances.copy()
+        resistances[indices] = values[:, 0]
+        self.reading_times[indices] = values[:, 1]
+        return resistances
+
+    '''Handles a truncated scan, whose readings are those of the first channels
+    of the route. The channels missing are read again if requery_missing is
+    set; otherwise, or if that fails too, they keep their previous readings.
+    After a timeout the rest of the timed-out response is waited for (at most
+    STALE_DRAIN_TIMEOUT) and thrown away first, so it cannot be taken for the
+    requery's; if it does not come, the channels are not requeried.
+
+    Params:
+        scanned: The channel numbers that were scanned
+        values: The readings received, see query_readings (or None)
 
+    Returns: the readings, of the first channels of scanned'''
+    def complete_scan(self, scanned, values):
+        if values is None or len(values) == len(scanned):
+            return values
+        missing = scanned[len(values):]
+        print("ERROR: " + self.name + " returned " + str(len(values)) + " of " + str(len(scanned)) + " readings, missing " + self.channel_list_string(missing))
+        if not self.requery_missing:
+            return values
+        if self.reader.stale and not self.reader.finish_stale(Constants.Constants.STALE_DRAIN_TIMEOUT):
+            print("Not requerying " + self.name + ", the rest of its timed-out response has not arrived")
+        else:
+            try:
+                values = np.vstack([values, self.read_data_from_card(self.sock, missing)])
+            except ValueError as e:
+                print(e.message + " (requerying missing channels)")
+        return values
 
-        '''Directly queries the card and extracts the resistances from the data.
+    '''Converts the instrument's reading timestamps (sec since its timestamp
+    reset) of one scan into Unix times. The first reading of a scan cannot
+    come before the scan was triggered, which anchors the instrument clock to
+    the host clock to within about one reading; the spacing between readings
+    is the instrument's own.
 
     Params:
-        sock: The socket to communicate with the card
-        channel_min: The minimum channel number to query (101 or 201)
-        channel_max: The maximum channel number to query (120 or 220)
+        timestamps: The timestamps of the readings of the scan, in order
+
+    Returns: a numpy array of sample times (Unix time)'''
+    def sample_times(self, timestamps):
+        return np.minimum(self.scan_started + (timestamps - timestamps[0]), time.time())
+
+    '''Formats a list of channel numbers as a SCPI channel list, collapsing
+    consecutive channels into ranges, e.g. (101, 102, 103, 117) -> "(@101:103,117)"'''
+    @staticmethod
+    def channel_list_string(channels):
+        parts = []
+        start = previous = channels[0]
+        for channel in list(channels[1:]) + [None]:
+            if channel != previous + 1:
+                parts.append(str(start) if start == previous else str(start) + ":" + str(previous))
+                start = channel
+            previous = channel
+        return "(@" + ",".join(parts) + ")"
 
-    Returns: a length-40 numpy array containing the resistances of the channels'''
-    def read_data_from_card(self, sock, channel_min, channel_max):
+    '''Pushes the measurement settings of all configured channels to the
+    instrument. Only needs to be done once per session: afterwards a scan needs
+    at most a new route (see set_scan_route) and a single READ?. Called again
+    whenever the channel configuration changes.
+
+    Params:
+        sock: The socket to communicate with the card'''
+    def configure_session(self, sock):
+        indices = self.configured_indices()
+        channels = self.channel_map.channels(indices).tolist()
         sock.send("*RST \n") #Resets Keithley
-        sock.send("FUNC 'RES',(@{cmin}:{cmax}) \n".format(cmin=str(channel_min), cmax=str(channel_max)))
+        self.next_reading_number = None #reading numbers start over
+        sock.send("FUNC 'RES',{route} \n".format(route=self.channel_list_string(channels)))
         sock.send("RES:RANG 1e5 \n")
 
-        sock.send("RES:NPLC 1,(@{cmin}:{cmax}) \n".format(cmin=str(channel_min), cmax=str(channel_max)))
+        for nplc in np.unique(self.nplc[indices]):
+            group = self.channel_map.channels(indices[self.nplc[indices] == nplc]).tolist()
+            sock.send("RES:NPLC {nplc},{route} \n".format(nplc=nplc, route=self.channel_list_string(group)))
         sock.send("SYST:AZER OFF \n")
         #5 is slow 1 is medium .1 is fast #.05 seems fastest! But as 12.15sec still far too long
         sock.send("TRAC:CLE \n") #Clear buffer
         sock.send("INIT:CONT OFF \n")
         sock.send("TRIG:SOUR IMM \n")
         sock.send("TRIG:COUN 1\n")
-        sock.send("SAMP:COUN 40\n")
         sock.send("TRIG:DEL 0\n") #.0005
-        sock.send("ROUT:SCAN (@{cmin}:{cmax}) \n".format(cmin=str(channel_min), cmax=str(channel_max)))
-        #Sets scan route 1 to 20 here
-
         sock.send("ROUT:SCAN:TSO IMM \n")
+        sock.send("FORM:ELEM READ,TST,RNUM \n") #Reading, timestamp, reading number
+        if self.data_format == "real":
+            sock.send("FORM:BORD SWAP \n") #Little-endian
+            sock.send("FORM:DATA DREAL \n") #Binary float64
+        self.session_configured = True
+        self.scan_route = None
+        print("Configured scan session for device " + self.name)
+
+    '''Programs the scan route. Only sent when the set of channels due differs
+    from the previous scan.
+
+    Params:
+        sock: The socket to communicate with the card
+        channels: The channel numbers to scan, in increasing order'''
+    def set_scan_route(self, sock, channels):
+        sock.send("ROUT:SCAN {route} \n".format(route=self.channel_list_string(channels)))
+        sock.send("SAMP:COUN {count}\n".format(count=len(channels)))
         sock.send("ROUT:SCAN:LSEL INT \n")
-        sock.send("READ? \n")
-        data = str(sock.recv(self.buffer_size)).strip().split(',')
-        if len(data) < 40*3 : #we got no or incomplete data
-            if len(data) <= 1: #we got an empty string
-                raise ValueError("ERROR: no data received from Keithley")
-            raise ValueError("ERROR: incomplete data received from Keithley")
-        resistances = []
-        for i in range(0, 40):
-            resistance = float(data[i*3].strip('OHM'))
-            if resistance > 1E7: #Open circuit
-                resistance = np.inf
-            resistances.append(resistance)
-        return np.array(resistances)
-
-    '''Configures a channel on the DMM.'''
+        self.scan_route = tuple(channels)
+
+    '''Makes sure the session is configured and the route matches the channels
+    about to be scanned.'''
+    def prepare_scan(self, sock, channels):
+        if not self.session_configured:
+            self.configure_session(sock)
+        if self.scan_route != tuple(channels):
+            self.set_scan_route(sock, channels)
+
+    '''Triggers one scan on the card and extracts the resistances from the data.
+    The session is (re)configured here only if it was reset, and the route
+    only if it differs from the previous scan.
+
+    Params:
+        sock: The socket to communicate with the card
+        channels: The channel numbers to scan, in increasing order
+
+    Returns: a numpy array with one row per scanned channel, in the same
+        order, of resistance, sample time and reading number'''
+    def read_data_from_card(self, sock, channels):
+        self.prepare_scan(sock, channels)
+        self.scan_started = time.time()
+        return self.query_readings("READ? \n", len(channels))
+
+    '''Starts a scan on the card without waiting for it (INIT). Collect the
+    readings later with fetch_data_from_card().
+
+    Params:
+        sock: The socket to communicate with the card
+        channels: The channel numbers to scan, in increasing order'''
+    def start_scan(self, sock, channels):
+        self.prepare_scan(sock, channels)
+        self.scan_started = time.time()
+        sock.send("INIT \n")
+        self.pending_scan = tuple(channels)
+
+    '''Fetches the readings of the scan started by start_scan(). If the scan is
+    still running, the instrument answers once it completes.
+
+    Params:
+        sock: The socket to communicate with the card
+        channels: The channel numbers that were scanned
+
+    Returns: a numpy array with one row per scanned channel, of resistance,
+        sample time and reading number'''
+    def fetch_data_from_card(self, sock, channels):
+        return self.query_readings("FETC? \n", len(channels))
+
+    '''Streaming mode: arms the trace buffer to store the next block of
+    stream_block scans of all configured channels. The instrument starts
+    scanning immediately and fills the buffer without further commands.
+
+    Params:
+        sock: The socket to communicate with the card'''
+    def start_stream(self, sock):
+        channels = tuple(self.channel_map.channels(self.configured_indices()).tolist())
+        self.prepare_scan(sock, channels)
+        sock.send("TRAC:CLE \n")
+        self.next_reading_number = None
+        sock.send("TRAC:POIN {count} \n".format(count=self.stream_block*len(channels)))
+        sock.send("TRAC:FEED SENS \n")
+        sock.send("TRAC:FEED:CONT NEXT \n") #fill the buffer once, then stop storing
+        sock.send("TRIG:COUN {count} \n".format(count=self.stream_block))
+        self.scan_started = time.time()
+        sock.send("INIT \n")
+        self.stream_channels = channels
+
+    '''Streaming mode: if the armed block is complete, reads the whole trace
+    buffer in one TRAC:DATA? and appends it to the ring buffer.
+
+    Params:
+        sock: The socket to communicate with the card
+
+    Returns: whether a block was drained (the buffer then needs re-arming)'''
+    def drain_stream(self, sock):
+        channels = self.stream_channels
+        count = self.stream_block*len(channels)
+        if int(float(self.reader.query("TRAC:POIN:ACT? \n"))) < count:
+            return False
+        values = self.query_readings("TRAC:DATA? \n", count)
+        num_scans = len(values) // len(channels) #complete scans, if the response was truncated
+        if num_scans == 0:
+            return True
+        values = values[:num_scans*len(channels)]
+        indices = self.channel_map.indices(channels)
+        scans = np.full((num_scans, self.num_channels), np.nan)
+        scans[:, indices] = values[:, 0].reshape(num_scans, len(channels))
+        self.stream_buffer.append(scans)
+        self.reading_times[indices] = values[-len(channels):, 1] #the newest scan
+        return True
+
+    '''Sends a query that returns readings (READ?, FETC? or TRAC:DATA?) and
+    decodes the response according to the data format. The instrument
+    timestamps are converted to sample times, see sample_times().
+    If the response is cut short, or times out part way, the complete
+    readings that did arrive are returned.
+
+    Params:
+        command: The query to send
+        num_readings: The number of readings expected
+
+    Returns: a numpy array with one row per reading, of resistance, sample
+        time (Unix time) and reading number. May have fewer than num_readings
+        rows.
+    Raises: ValueError if no complete reading arrived'''
+    def query_readings(self, command, num_readings):
+        try:
+            if self.data_format == "real":
+                #Binary block: "#0" header, 3x8 bytes per reading, then the terminator
+                payload = self.reader.query_bytes(command, 2 + 24*num_readings + 1)
+                readings = self.parse_real_data(payload, num_readings)
+            else:
+                readings = self.parse_ascii_data(self.reader.query(command).decode("ascii"), num_readings)
+        except ValueError:
+            if not self.reader.partial: #nothing arrived at all
+                raise
+            readings = self.parse_partial_data(self.reader.partial, num_readings)
+        self.check_reading_numbers(readings)
+        readings[:, 1] = self.sample_times(readings[:, 1])
+        return readings
+
+    '''Checks by their reading numbers that readings are one contiguous run,
+    following on from the previous response (or starting over at 0 or 1), so
+    the late tail of an earlier response or fields out of step are never taken
+    for this scan's readings. Misaligned data is thrown away, with anything
+    else waiting on the socket.
+
+    Params:
+        readings: The decoded readings, see query_readings
+    Raises: ValueError if the readings are misaligned'''
+    def check_reading_numbers(self, readings):
+        numbers = readings[:, 2]
+        expected = (0, 1, self.next_reading_number) if self.next_reading_number is not None else (numbers[0],)
+        if numbers[0] not in expected or np.any(np.diff(numbers) != 1):
+            self.next_reading_number = None
+            self.reader.discard_pending()
+            raise ValueError("ERROR: misaligned readings from " + self.name + ", reading numbers "
+                             + str(int(numbers[0])) + " to " + str(int(numbers[-1])))
+        #after a timeout, the readings still to come are unknown
+        self.next_reading_number = None if self.reader.stale else numbers[-1] + 1
+
+    '''Decodes an ASCII response of value/timestamp/reading number triples,
+    e.g. "+1.00E+04OHM,+12.345SECS,+00001RDNG#,...", in one vectorized pass:
+    the unit suffixes are stripped with one regular expression and all fields
+    converted to float64 at once.
+
+    Params:
+        response: The response string
+        num_readings: The number of readings expected
+
+    Returns: a numpy array with one row per reading, of resistance,
+        timestamp and reading number. Fewer rows if the response is short.'''
+    @staticmethod
+    def parse_ascii_data(response, num_readings):
+        data = UNIT_SUFFIX.sub("", response.strip()).split(',')
+        num_readings = min(num_readings, len(data) // 3) #complete triples only, if the response is short
+        if num_readings == 0: #we got no data
+            raise ValueError("ERROR: no data received from Keithley")
+        readings = np.array(data[:num_readings*3], dtype=float).reshape(num_readings, 3)
+        readings[readings[:, 0] > 1E7, 0] = np.inf #Open circuit
+        return readings
+
+    '''Decodes a binary (FORM:DATA DREAL, FORM:BORD SWAP) response of
+    value/timestamp/reading number triples in a single vectorized step.
+
+    Params:
+        payload: The raw bytes of the response, including the "#0" header
+        num_readings: The number of readings expected
+
+    Returns: a float64 numpy array with one row per reading, of resistance,
+        timestamp and reading number. Fewer rows if the payload is short.'''
+    @staticmethod
+    def parse_real_data(payload, num_readings):
+        if payload[:2] != b"#0":
+            raise ValueError("ERROR: invalid binary data received from Keithley")
+        num_readings = min(num_readings, (len(payload) - 2) // 24)
+        if num_readings <= 0:
+            raise ValueError("ERROR: no data received from Keithley")
+        readings = np.frombuffer(payload, dtype="<f8", count=3*num_readings, offset=2).reshape(num_readings, 3).copy()
+        readings[readings[:, 0] > 1E7, 0] = np.inf #Open circuit
+        return readings
+
+    '''Decodes the complete readings at the start of a response that timed out
+    part way.
+
+    Params:
+        partial: The bytes received before the timeout
+        num_readings: The number of readings expected
+
+    Returns: a numpy array with one row per complete reading, see
+        parse_ascii_data and parse_real_data'''
+    def parse_partial_data(self, partial, num_readings):
+        if self.data_format == "real":
+            return self.parse_real_data(partial, num_readings)
+        text = partial.decode("ascii", "ignore")
+        return self.parse_ascii_data(text[:text.rfind(",")], num_readings) #drop the cut off field
+
+    '''Configures a channel on the DMM. All its params are checked before any
+    is applied, so an invalid config leaves the channel as it was.
+
+    Raises: ValueError if the channel or a param is invalid'''
     def configure_channel(self, channel_number, params):
-        index = Tools.channel_number_to_array_index(channel_number)
+        index = self.channel_map.index(channel_number)
+        if "name" not in params:
+            raise ValueError("Channel " + str(channel_number) + " of " + self.name + " has no name")
+        calibration = self.calibration.parse_channel(params)
+        channel_filter = self.filter.parse_channel(params)
+        nplc = float(params.get("nplc", 1))
+        scan_every = max(1, int(params.get("scan_every", 1)))
+        #all valid, apply them together
         self.channel_names[index] = params["name"]
-        self.resistance_25C[index] = params["resistance_25c"]
-        self.beta[index] = params["beta"]
-        self.offset[index] = params["offset"] if "offset" in params else 0
+        self.calibration.set_channel(index, calibration)
+        self.filter.set_channel(index, channel_filter)
+        self.nplc[index] = nplc
+        self.scan_every[index] = scan_every
+        self.configured[index] = True
+        self.session_configured = False #push the scan session again on the next read
 
-    '''Logs the current time, followed by data stored in the Keithley object'''
+    '''Logs the filtered temps of all channels in one row. The row time is
+    when the newest reading was sampled (by the instrument's timestamps) if a
+    reading arrived since the last row, else the current tick (e.g. while
+    disconnected). Channels scanned less often (scan_every) hold their latest
+    value, sampled up to scan_every ticks before the row time.'''
     def log(self):
-        current_mjd = Tools.get_modified_julian_date()
-        if int(current_mjd) != self.current_modified_julian_date: #we've crossed midnight
-            self.current_modified_julian_date = int(current_mjd) #update julian date
-            self.create_log_file()
-        with open(self.log_file, "a") as f:
-            f.write(json.dumps([Tools.get_modified_julian_date(), self.temps.tolist()])+"\n")
+        newest = np.max(self.reading_times)
+        if newest > self.logged_reading_time:
+            self.logged_reading_time = newest
+            current_mjd = Clock.unix_to_mjd(newest)
+        else:
+            current_mjd = Clock.CLOCK.tick_mjd
+        self.device_log.write(current_mjd, self.temps.tolist(), self.column_names())
+
+    '''Returns the name of each channel for the log, its channel number if
+    it has none'''
+    def column_names(self):
+        return [str(name) if name != "" else str(channel) for name, channel in zip(self.channel_names, self.channel_map.channel_numbers)]
 
     '''Closes the device by closing its socket.'''
     def close(self):
+        if self.stream is not None:
+            self.stream.stop()
+            self.stream.join(Constants.Constants.SCPI_TIMEOUT)
         self.sock.close()
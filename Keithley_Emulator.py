@@ -0,0 +1,301 @@
+'''Local emulator of a Keithley 2701 for exercising and benchmarking the
+acquisition code without the physical DMMs. Speaks the SCPI subset that
+Keithley_DMM uses (*RST, FUNC, RES:NPLC, ROUT:SCAN, SAMP:COUN, TRIG:COUN,
+READ?, INIT, FETC?, TRAC:*, FORM:*) over TCP.
+
+Usage: python Keithley_Emulator.py [--port 1394] [--fragment 0.5] [--drop 0.01]
+    [--truncate 0.01]
+Then point a Keithley device at address = "127.0.0.1" (and port = ...).'''
+
+from __future__ import division, print_function
+import argparse
+import math
+import random
+import socket
+import struct
+import threading
+import time
+
+try:
+    import socketserver
+except ImportError: #Python 2
+    import SocketServer as socketserver
+
+OPEN_CIRCUIT = 9.9E37 #What the 2701 returns for an open input
+LINE_FREQUENCY = 60 #Hz, one NPLC is 1/60 s
+
+
+'''Default resistance waveform: a 10 kOhm thermistor drifting slowly with a
+little noise, phase shifted per channel so channels are distinguishable.'''
+def default_waveform(channel):
+    phase = channel % 40
+    return lambda t: 10000*(1 + 0.01*math.sin(2*math.pi*t/600 + phase)) + random.gauss(0, 0.5)
+
+
+'''State of the emulated instrument, shared by all connections like a real
+2701 with several sockets open.'''
+class Keithley_Emulator_State():
+
+    '''Params:
+        waveforms: dict of channel number -> function of time (sec) returning
+            the resistance. Channels not in the dict read as open circuits.
+        reading_delay: Fixed time per reading (sec). If None, NPLC/60 is used.'''
+    def __init__(self, waveforms, reading_delay = None):
+        self.waveforms = waveforms
+        self.reading_delay = reading_delay
+        self.lock = threading.Lock()
+        self.start_time = time.time()
+        self.reset()
+
+    '''*RST: back to power-on defaults'''
+    def reset(self):
+        self.nplc = {} #channel -> nplc
+        self.route = []
+        self.sample_count = 1
+        self.trigger_count = 1
+        self.elements = ["READ", "TST", "RNUM"]
+        self.data_format = "ASC"
+        self.byte_order = "NORM"
+        self.reading_number = 0
+        self.trace_points = 0
+        self.trace_feed = "NEV"
+        self.trace = [] #(value, timestamp, reading number) stored by the trace buffer
+        self.scan_started = None #time of the last INIT, or None
+        self.scan_readings = [] #readings of the last INIT/READ?
+
+    '''Returns the seconds one reading on a channel takes'''
+    def reading_time(self, channel):
+        if self.reading_delay is not None:
+            return self.reading_delay
+        return self.nplc.get(channel, 1)/LINE_FREQUENCY
+
+    '''Takes (instantaneously, timestamped as if spread out) the readings of
+    trigger_count scans of sample_count readings over the route, starting
+    at time start.'''
+    def take_readings(self, start):
+        readings = []
+        elapsed = 0
+        route = self.route or [101]
+        for i in range(self.trigger_count*self.sample_count):
+            channel = route[i % len(route)]
+            elapsed += self.reading_time(channel)
+            waveform = self.waveforms.get(channel)
+            value = waveform(start + elapsed - self.start_time) if waveform else OPEN_CIRCUIT
+            self.reading_number += 1
+            readings.append((value, start + elapsed - self.start_time, self.reading_number))
+        return readings, elapsed
+
+    '''Formats readings for the wire according to FORM:DATA and FORM:ELEM'''
+    def format_readings(self, readings):
+        if self.data_format in ("REAL", "DRE", "DREAL", "SRE", "SREAL"):
+            code = "f" if self.data_format.startswith("S") else "d"
+            order = "<" if self.byte_order.startswith("SWAP") else ">"
+            values = []
+            for value, timestamp, number in readings:
+                values.append(value)
+                if "TST" in self.elements:
+                    values.append(timestamp)
+                if "RNUM" in self.elements:
+                    values.append(number)
+            return b"#0" + struct.pack(order + code*len(values), *values) + b"\n"
+        fields = []
+        for value, timestamp, number in readings:
+            fields.append("%+.8EOHM" % value)
+            if "TST" in self.elements:
+                fields.append("%+.3fSECS" % timestamp)
+            if "RNUM" in self.elements:
+                fields.append("%+06dRDNG#" % number)
+        return (",".join(fields) + "\n").encode("ascii")
+
+
+'''Handler for one client connection'''
+class Keithley_Emulator_Handler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            for command in line.decode("ascii").strip().split(";"):
+                if command.strip():
+                    response = self.execute(command.strip())
+                    if response is not None:
+                        if random.random() < self.server.drop_probability:
+                            print("Emulator: dropping connection")
+                            return
+                        if random.random() < self.server.truncate_probability:
+                            print("Emulator: truncating response")
+                            response = response[:random.randint(0, len(response) - 1)] #and no terminator
+                        self.send(response)
+
+    '''Sends a response, split into random fragments with short pauses if
+    fragmentation is enabled'''
+    def send(self, response):
+        if random.random() >= self.server.fragment_probability or len(response) < 2:
+            self.wfile.write(response)
+            return
+        position = 0
+        while position < len(response):
+            size = random.randint(1, max(1, len(response)//3))
+            self.wfile.write(response[position:position + size])
+            self.wfile.flush()
+            time.sleep(0.001)
+            position += size
+
+    '''Executes one command. Returns the response bytes, or None'''
+    def execute(self, command):
+        state = self.server.state
+        header, _, argument = command.partition(" ")
+        header = header.upper()
+        argument = argument.strip()
+        with state.lock:
+            if header == "*RST":
+                state.reset()
+            elif header == "*IDN?":
+                return b"KEITHLEY INSTRUMENTS INC.,MODEL 2701,EMULATOR,A01\n"
+            elif header.startswith("RES:NPLC") or header.startswith("SENS:RES:NPLC"):
+                value, channels = self.split_channel_argument(argument)
+                for channel in channels:
+                    state.nplc[channel] = float(value)
+            elif header == "ROUT:SCAN":
+                state.route = self.parse_channel_list(argument)
+            elif header == "SAMP:COUN":
+                state.sample_count = int(float(argument))
+            elif header == "TRIG:COUN":
+                state.trigger_count = 1 if argument.upper().startswith("INF") else int(float(argument))
+            elif header == "FORM:ELEM":
+                state.elements = []
+                for element in argument.upper().split(","):
+                    element = element.strip()
+                    state.elements.append("RNUM" if element.startswith("RNUM") else element[:4])
+            elif header == "FORM:DATA":
+                state.data_format = argument.upper().split(",")[0]
+            elif header == "FORM:BORD":
+                state.byte_order = argument.upper()
+            elif header == "TRAC:CLE":
+                state.trace = []
+                state.trace_feed = "NEV"
+            elif header == "TRAC:POIN":
+                state.trace_points = int(float(argument))
+            elif header == "TRAC:FEED:CONT":
+                state.trace_feed = argument.upper()[:3]
+            elif header == "INIT":
+                now = time.time()
+                readings, _ = state.take_readings(now)
+                state.scan_started = now
+                state.scan_readings = readings
+                if state.trace_feed == "NEX":
+                    state.trace = readings[:state.trace_points]
+            elif header == "READ?":
+                readings, elapsed = state.take_readings(time.time())
+                state.scan_readings = readings
+                state.scan_started = None
+                delay = elapsed
+            elif header == "FETC?":
+                readings = state.scan_readings
+                delay = self.remaining(state)
+            elif header == "TRAC:POIN:ACT?":
+                return (str(self.stored_points(state)) + "\n").encode("ascii")
+            elif header == "TRAC:DATA?":
+                readings = state.trace[:self.stored_points(state)]
+                delay = 0
+            #Everything else (FUNC, RANG, AZER, TRIG:SOUR, ...) is accepted and ignored
+            if header in ("READ?", "FETC?", "TRAC:DATA?"):
+                response = state.format_readings(readings)
+            else:
+                return None
+        time.sleep(delay) #integration time, outside the lock like a busy instrument
+        return response
+
+    '''Seconds until the scan started by INIT completes'''
+    def remaining(self, state):
+        if state.scan_started is None:
+            return 0
+        duration = sum(state.reading_time(state.route[i % len(state.route)]) for i in range(len(state.scan_readings))) if state.route else 0
+        return max(0, state.scan_started + duration - time.time())
+
+    '''Number of trace buffer points filled so far since INIT'''
+    def stored_points(self, state):
+        if state.scan_started is None:
+            return len(state.trace)
+        elapsed = time.time() - state.scan_started
+        done = 0
+        for value, timestamp, number in state.trace:
+            if timestamp - (state.scan_started - state.start_time) <= elapsed:
+                done += 1
+        return done
+
+    '''Splits "value,(@list)" into the value and the list of channels'''
+    def split_channel_argument(self, argument):
+        if ",(@" in argument:
+            value, channel_list = argument.split(",(@", 1)
+            return value, self.parse_channel_list("(@" + channel_list)
+        return argument, []
+
+    '''Parses a SCPI channel list such as "(@101:103,117)"'''
+    @staticmethod
+    def parse_channel_list(argument):
+        channels = []
+        for part in argument.strip().strip("(@)").split(","):
+            if ":" in part:
+                first, last = part.split(":")
+                channels.extend(range(int(first), int(last) + 1))
+            elif part:
+                channels.append(int(part))
+        return channels
+
+
+'''Threaded TCP server holding the emulated instrument'''
+class Keithley_Emulator(socketserver.ThreadingMixIn, socketserver.TCPServer):
+
+    allow_reuse_address = True
+    daemon_threads = True
+
+    '''Params:
+        port: TCP port to listen on (0 picks a free one, see self.port)
+        waveforms: dict of channel number -> function of time returning the
+            resistance. Defaults to default_waveform() on all 40 channels.
+        reading_delay: Fixed time per reading (sec); None uses NPLC/60
+        fragment_probability: Chance that a response is sent in fragments
+        drop_probability: Chance that the connection is dropped instead of
+            answering a query
+        truncate_probability: Chance that a response stops part way, without
+            its terminator, like a stalled instrument'''
+    def __init__(self, port = 1394, waveforms = None, reading_delay = None,
+                 fragment_probability = 0, drop_probability = 0, truncate_probability = 0):
+        if waveforms is None:
+            channels = list(range(101, 121)) + list(range(201, 221))
+            waveforms = dict((channel, default_waveform(channel)) for channel in channels)
+        self.state = Keithley_Emulator_State(waveforms, reading_delay)
+        self.fragment_probability = fragment_probability
+        self.drop_probability = drop_probability
+        self.truncate_probability = truncate_probability
+        socketserver.TCPServer.__init__(self, ("127.0.0.1", port), Keithley_Emulator_Handler)
+        self.port = self.server_address[1]
+
+    '''Starts serving in a daemon thread and returns immediately'''
+    def start(self):
+        thread = threading.Thread(target = self.serve_forever)
+        thread.daemon = True
+        thread.start()
+        return thread
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Emulate a Keithley 2701 over TCP")
+    parser.add_argument("--port", type = int, default = 1394)
+    parser.add_argument("--reading-delay", type = float, default = None,
+                        help = "fixed seconds per reading (default NPLC/60)")
+    parser.add_argument("--fragment", type = float, default = 0,
+                        help = "probability a response is split into fragments")
+    parser.add_argument("--drop", type = float, default = 0,
+                        help = "probability the connection is dropped on a query")
+    parser.add_argument("--truncate", type = float, default = 0,
+                        help = "probability a response stops part way")
+    args = parser.parse_args()
+    emulator = Keithley_Emulator(args.port, reading_delay = args.reading_delay,
+                                 fragment_probability = args.fragment, drop_probability = args.drop,
+                                 truncate_probability = args.truncate)
+    print("Keithley 2701 emulator listening on port " + str(emulator.port))
+    emulator.serve_forever()
@@ -0,0 +1,49 @@
+import threading
+import socket
+import Constants
+
+
+'''Background thread that drains a streaming Keithley_DMM. The instrument
+scans into its own trace buffer; this thread polls it and bulk-reads each
+completed block (TRAC:DATA?) into the Keithley's ring buffer, so the control
+loop never waits on the instrument.'''
+class Keithley_Stream(threading.Thread):
+
+    '''Params:
+        keithley: The Keithley_DMM object to drain'''
+    def __init__(self, keithley):
+        threading.Thread.__init__(self) #Must call this for the thread to be set up correctly
+        self.keithley = keithley
+        self.stop_flag = threading.Event()
+        self.daemon = True #it will kill automatically, don't have to worry about zombies
+
+    '''Run method for the thread. Arms the trace buffer, then drains it every
+    time a block completes until stop() is called.'''
+    def run(self):
+        armed = False
+        while not self.stop_flag.is_set():
+            if not self.keithley.connected: #the supervisor is reconnecting
+                armed = False
+                self.stop_flag.wait(Constants.Constants.STREAM_POLL_INTERVAL)
+                continue
+            try:
+                if not armed:
+                    self.keithley.start_stream(self.keithley.sock)
+                    armed = True
+                block_done = self.keithley.drain_stream(self.keithley.sock)
+                self.keithley.failed_reads = 0
+                if block_done:
+                    armed = False
+                    continue #re-arm straight away
+            except socket.error as e:
+                self.keithley.connection_lost(e)
+                armed = False
+            except ValueError as e:
+                print("ERROR streaming from " + self.keithley.name + ": " + str(e))
+                self.keithley.read_failed(e)
+                armed = False
+            self.stop_flag.wait(Constants.Constants.STREAM_POLL_INTERVAL)
+
+    '''Stops the thread after the current poll'''
+    def stop(self):
+        self.stop_flag.set()
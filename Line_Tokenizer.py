@@ -0,0 +1,65 @@
+PRESERVE_CASE = ("table",) #parameters whose values keep their case, e.g. file paths
+
+
+class LineTokenizer:
+
+        '''Parses a line of the file into useful tokens. A complicated function
+        that more or less takes in a line from the config file and breaks it into
+        parts the rest of the program understands. Deletes comments, whitespace.
+
+        Params:
+            line: A line of text from the config file
+        Returns: A list of arguments contained in the line. A bracketed list
+        such as [101, 102, 103] becomes one token, a list of strings.
+        Everything is lowercased except the values of PRESERVE_CASE parameters.
+        If the line is invalid or pure whitespace, returns an empty list.'''
+        @staticmethod
+        def tokenize_line(line):
+            if line is None:
+                return []
+            line = line.strip().replace("=", " ").replace(":", " ").replace(",", " ")
+            line = line.replace("[", " [ ").replace("]", " ] ")
+            if line == "":
+                return [] #our line is pure whitespace
+            hash_position = line.find('#')
+            if hash_position == 0:
+                return [] #pure comment
+            elif hash_position > 0: #there is a hash, but it isn't first character
+                line = line[:hash_position]
+            raw_tokens = line.split() #use first pass with Python's tokenizer, then clean up
+            tokens = []
+            in_quote = False
+            in_brackets = False
+            current_token = ""
+            current_list = []
+            for token in raw_tokens: #this is all quote mark, equals, and bracket handling!
+                if in_quote:
+                    if token[-1] == '"':
+                        in_quote = False
+                        tokens.append(current_token + " " + token[:-1])
+                        current_token = ""
+                    else:
+                        current_token += (" " + token)
+                elif in_brackets: #assume we only have numbers in brackets
+                    if token == "]":
+                        in_brackets = False
+                        tokens.append(current_list)
+                        current_list = []
+                    else:
+                        current_list.append(token)
+                elif token == "[":
+                    in_brackets = True
+                else:
+                    if token[0] == '"':
+                        if token[-1] == '"':
+                            tokens.append(token[1:-1])
+                        else:
+                            in_quote = True
+                            current_token = token[1:]
+                    else:
+                        tokens.append(token)
+            for i, token in enumerate(tokens):
+                if i >= 2 and i % 2 == 0 and tokens[i - 1] in PRESERVE_CASE:
+                    continue #a value, and tokens[i - 1] is already lowercase
+                tokens[i] = [item.lower() for item in token] if isinstance(token, list) else token.lower()
+            return tokens
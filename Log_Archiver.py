@@ -0,0 +1,155 @@
+'''Compression of old device day files. A day file older than
+Constants.ARCHIVE_AFTER_DAYS is rewritten as <mjd>.<ext>.gz in frames of
+about Constants.ARCHIVE_FRAME_SIZE bytes of whole rows (or lines), with a
+frame index next to it (see Log_Format), and the plain file is removed.
+Log_Format.read_day reads plain and compressed days alike.
+
+Usage: python Log_Archiver.py [--days 7] Logging archives every device
+once; the control loop runs a Log_Archiver thread that does so hourly.'''
+
+from __future__ import division, print_function
+import argparse
+import json
+import os
+import threading
+import numpy as np
+import Constants
+import Clock
+import Log_Format
+
+LOGGING_DIRECTORY = os.path.join(os.getcwd(), "Logging")
+
+
+'''Splits the contents of a day file into frames of whole rows (binary) or
+lines (JSON). A binary header gets a frame of its own.
+
+Returns: list of (uncompressed offset, data, first mjd)'''
+def split_frames(path, data, frame_size):
+    frames = []
+    if Log_Format.is_binary(path):
+        header, offset = Log_Format.read_header(path)
+        frames.append((0, data[:offset], None))
+        row_size = np.dtype(header["dtype"]).itemsize*len(header["columns"])
+        step = max(1, frame_size // row_size)*row_size
+        for start in range(offset, len(data), step):
+            chunk = data[start:start + step]
+            first_mjd = float(np.frombuffer(chunk[:8], dtype=header["dtype"])[0]) if len(chunk) >= 8 else None
+            frames.append((start, chunk, first_mjd))
+    else:
+        start = 0
+        while start < len(data):
+            end = data.find(b"\n", start + frame_size)
+            end = len(data) if end < 0 else end + 1
+            chunk = data[start:end]
+            first_line = chunk.lstrip().split(b"\n", 1)[0]
+            first_mjd = json.loads(first_line.decode("utf-8"))[0] if first_line else None
+            frames.append((start, chunk, first_mjd))
+            start = end
+    if len(frames) > 1 and frames[-1][2] is None: #a row cut short by a crash
+        frames[-2] = (frames[-2][0], frames[-2][1] + frames[-1][1], frames[-2][2])
+        frames.pop()
+    return frames
+
+
+'''Compresses one day file and removes the original. A row or line left
+incomplete by a crash is dropped first. The compressed file and index are
+written under temporary names, checked, and renamed into place before the
+original is removed, so the day is always readable.
+
+Params:
+    path: The plain day file
+    frame_size: Uncompressed bytes per frame
+
+Returns: the path of the compressed file'''
+def archive_day(path, frame_size = None):
+    if frame_size is None:
+        frame_size = Constants.Constants.ARCHIVE_FRAME_SIZE
+    Log_Format.truncate_partial(path)
+    with open(path, "rb") as f:
+        data = f.read()
+    compressed_path = path + Log_Format.COMPRESSED_EXTENSION
+    index_path = compressed_path + Log_Format.INDEX_EXTENSION
+    frames = []
+    position = 0
+    with open(compressed_path + ".tmp", "wb") as f:
+        for offset, chunk, first_mjd in split_frames(path, data, frame_size):
+            frames.append([offset, position, first_mjd])
+            compressed = Log_Format.compress_frame(chunk)
+            f.write(compressed)
+            position += len(compressed)
+    with open(compressed_path + ".tmp", "rb") as f:
+        if Log_Format.decompress_frames(f.read()) != data:
+            os.remove(compressed_path + ".tmp")
+            raise ValueError("ERROR: compressed copy of " + path + " does not match")
+    with open(index_path + ".tmp", "w") as f:
+        json.dump({"size": len(data), "frames": frames}, f)
+    os.rename(index_path + ".tmp", index_path)
+    os.rename(compressed_path + ".tmp", compressed_path)
+    os.remove(path)
+    return compressed_path
+
+
+'''Compresses the plain day files of all devices that are at least a
+number of days old.
+
+Params:
+    directory: The logging directory, with a subdirectory per device
+    age_days: Minimum age in days, at least 1 so today's file is never touched
+
+Returns: the number of day files compressed'''
+def archive_all(directory, age_days):
+    last_day = int(Clock.CLOCK.now()) - max(1, age_days)
+    count = 0
+    for device in sorted(os.listdir(directory)):
+        device_directory = os.path.join(directory, device)
+        if not os.path.isdir(device_directory):
+            continue
+        for day in Log_Format.list_days(device_directory):
+            if day > last_day:
+                break
+            for extension in (Log_Format.BINARY_EXTENSION, Log_Format.JSON_EXTENSION):
+                path = os.path.join(device_directory, str(day) + extension)
+                if os.path.exists(path):
+                    try:
+                        archive_day(path)
+                        count += 1
+                    except (IOError, OSError, ValueError) as e:
+                        print("ERROR archiving " + path + ": " + str(e))
+    return count
+
+
+'''Background thread that compresses old day files every
+Constants.ARCHIVE_INTERVAL, off the control loop's thread.'''
+class Log_Archiver(threading.Thread):
+
+    '''Params:
+        directory: The logging directory
+        age_days: Compress day files at least this many days old'''
+    def __init__(self, directory = LOGGING_DIRECTORY, age_days = None):
+        threading.Thread.__init__(self) #Must call this for the thread to be set up correctly
+        self.directory = directory
+        self.age_days = Constants.Constants.ARCHIVE_AFTER_DAYS if age_days is None else age_days
+        self.stop_flag = threading.Event()
+        self.daemon = True #it will kill automatically, don't have to worry about zombies
+
+    '''Run method for the thread. Archives, then sleeps, until stop() is called.'''
+    def run(self):
+        while not self.stop_flag.is_set():
+            if os.path.isdir(self.directory):
+                count = archive_all(self.directory, self.age_days)
+                if count:
+                    print("Archived " + str(count) + " log files")
+            self.stop_flag.wait(Constants.Constants.ARCHIVE_INTERVAL)
+
+    '''Stops the thread after the current pass'''
+    def stop(self):
+        self.stop_flag.set()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Compress old device day files")
+    parser.add_argument("directory", nargs = "?", default = LOGGING_DIRECTORY, help = "logging directory")
+    parser.add_argument("--days", type = int, default = Constants.Constants.ARCHIVE_AFTER_DAYS,
+                        help = "compress day files at least this many days old")
+    args = parser.parse_args()
+    print("Archived " + str(archive_all(args.directory, args.days)) + " log files")
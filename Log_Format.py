@@ -0,0 +1,373 @@
+'''Reading and writing of device day files, Logging/<device>/<mjd>.<ext>.
+
+Two formats are supported:
+    JSON (.txt): one line per log entry, [mjd, [value, value, ...]]. The
+        original format, kept for compatibility.
+    Binary (.bin): a single header line, MAGIC followed by a JSON object with
+        the device name and type, the column names (e.g. channel names) and
+        the dtype, padded so the rows start 8-byte aligned. Then fixed-width
+        rows of little-endian float64, [mjd, value, value, ...]. A whole day
+        can be np.memmap'ed without any parsing.
+Either may be archived compressed (.txt.gz, .bin.gz, see Log_Archiver): a
+series of gzip members ("frames") of whole rows or lines, so the file is
+still a valid gzip file, with a JSON index (.gz.idx) giving each frame's
+offsets and first MJD, so a time range can be read by decompressing only the
+frames that cover it. read_day() reads all of these the same way.
+
+Usage as a converter: python Log_Format.py [--type keithley] [--columns a,b,...] Logging/keithley1/*.txt
+replaces each JSON day file, except today's, with a .bin. The column names
+default to those of the device's newest binary day file.'''
+
+from __future__ import division, print_function
+import argparse
+import json
+import os
+import zlib
+from bisect import bisect_right
+import numpy as np
+import Clock
+
+MAGIC = b"#TCLOG1 "
+DTYPE = "<f8"
+JSON_EXTENSION = ".txt"
+BINARY_EXTENSION = ".bin"
+COMPRESSED_EXTENSION = ".gz"
+INDEX_EXTENSION = ".idx"
+#Day file extensions in order of preference
+DAY_EXTENSIONS = (BINARY_EXTENSION, JSON_EXTENSION,
+                  BINARY_EXTENSION + COMPRESSED_EXTENSION, JSON_EXTENSION + COMPRESSED_EXTENSION)
+
+
+'''Builds the header line of a binary day file.
+
+Params:
+    device_name: The name of the device
+    device_type: The device type, e.g. "keithley"
+    columns: Names of all the columns, starting with "mjd"
+
+Returns: the header as bytes, a multiple of 8 bytes long'''
+def make_header(device_name, device_type, columns):
+    header = json.dumps({"device": device_name, "type": device_type,
+                         "columns": list(columns), "dtype": DTYPE})
+    line = MAGIC + header.encode("utf-8")
+    return line + b" "*(-(len(line) + 1) % 8) + b"\n"
+
+
+'''Makes sure a binary file with the given columns exists, to append rows
+to. A new file is written under a temporary name with its header and renamed
+into place, so readers never see a file without a complete header. An
+existing file with a different number of columns is moved aside to
+<path>.<n> rather than appended to; one with the same number but other names
+(e.g. a channel renamed) is appended to and keeps its header.
+
+Params:
+    path: The binary file
+    device_name, device_type, columns: see make_header()'''
+def create_binary(path, device_name, device_type, columns):
+    if os.path.exists(path) and len(read_header(path)[0]["columns"]) != len(columns):
+        suffix = 1
+        while os.path.exists(path + "." + str(suffix)):
+            suffix += 1
+        print("ERROR: columns of " + device_name + " changed, moving " + path + " aside")
+        os.rename(path, path + "." + str(suffix))
+    if not os.path.exists(path):
+        with open(path + ".tmp", "wb") as f:
+            f.write(make_header(device_name, device_type, columns))
+        os.rename(path + ".tmp", path)
+
+
+'''Cuts off a row (binary) or line (JSON) left incomplete at the end of a
+file by a crash, so rows appended after it stay aligned.
+
+Params:
+    path: A plain day file, or any other binary file of this format'''
+def truncate_partial(path):
+    size = os.path.getsize(path)
+    if is_binary(path):
+        header, offset = read_header(path)
+        row_size = np.dtype(header["dtype"]).itemsize*len(header["columns"])
+        end = offset + (size - offset) // row_size * row_size
+    else:
+        with open(path, "rb") as f:
+            end = f.read().rfind(b"\n") + 1
+    if end < size:
+        print("ERROR: dropping an incomplete row at the end of " + path)
+        with open(path, "r+b") as f:
+            f.truncate(end)
+
+
+'''Packs one row, [mjd, value, ...], for a binary day file'''
+def pack_row(values):
+    return np.asarray(values, dtype=DTYPE).tobytes()
+
+
+'''Whether a day file, plain or compressed, is in the binary format'''
+def is_binary(path):
+    if path.endswith(COMPRESSED_EXTENSION):
+        path = path[:-len(COMPRESSED_EXTENSION)]
+    return path.endswith(BINARY_EXTENSION)
+
+
+'''Reads the header of a binary day file, plain or compressed.
+
+Returns: the header dict, and the byte offset of the first row
+Raises: ValueError if the file is not a binary day file'''
+def read_header(path):
+    if path.endswith(COMPRESSED_EXTENSION):
+        data = read_frames(path, 0, 1)
+        line = data[:data.find(b"\n") + 1]
+    else:
+        with open(path, "rb") as f:
+            line = f.readline()
+    if not line.startswith(MAGIC):
+        raise ValueError("ERROR: not a binary log file: " + path)
+    return json.loads(line[len(MAGIC):].decode("utf-8")), len(line)
+
+
+'''Parses the contents of a binary day file (header and rows).
+
+Returns: the header dict, and a (rows, columns) array'''
+def parse_binary(data):
+    line = data[:data.find(b"\n") + 1]
+    if not line.startswith(MAGIC):
+        raise ValueError("ERROR: not binary log data")
+    header = json.loads(line[len(MAGIC):].decode("utf-8"))
+    width = len(header["columns"])
+    num_rows = (len(data) - len(line)) // (np.dtype(header["dtype"]).itemsize * width)
+    rows = np.frombuffer(data, dtype=header["dtype"], count=num_rows*width, offset=len(line))
+    return header, rows.reshape(num_rows, width)
+
+
+'''Maps the rows of a binary day file. A row cut short by a crash is ignored.
+
+Returns: the header dict, and a read-only (rows, columns) array'''
+def read_binary_day(path):
+    header, offset = read_header(path)
+    width = len(header["columns"])
+    num_rows = (os.path.getsize(path) - offset) // (np.dtype(header["dtype"]).itemsize * width)
+    if num_rows == 0:
+        return header, np.empty((0, width))
+    return header, np.memmap(path, dtype=header["dtype"], mode="r", offset=offset, shape=(num_rows, width))
+
+
+'''Parses JSON day file lines into a (rows, columns) array, [mjd, value, ...].
+A last line cut short by a crash is skipped.'''
+def parse_json(lines):
+    lines = [line for line in lines if line.strip()]
+    rows = []
+    for number, line in enumerate(lines):
+        try:
+            entry = json.loads(line.decode("utf-8"))
+        except ValueError:
+            if number < len(lines) - 1:
+                raise
+            break
+        rows.append([entry[0]] + list(entry[1]))
+    return np.array(rows, dtype=float)
+
+
+'''Parses a JSON day file into a (rows, columns) array, [mjd, value, ...]'''
+def read_json_day(path):
+    with open(path, "rb") as f:
+        return parse_json(f)
+
+
+'''Compresses one frame of a compressed day file, as a gzip member'''
+def compress_frame(data, level = 6):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return compressor.compress(data) + compressor.flush()
+
+
+'''Decompresses consecutive gzip members'''
+def decompress_frames(data):
+    chunks = []
+    while data:
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        chunks.append(decompressor.decompress(data))
+        data = decompressor.unused_data
+    return b"".join(chunks)
+
+
+'''Reads the frame index of a compressed day file, None if it has none.
+The index is {"size": uncompressed size, "frames": [[uncompressed offset,
+compressed offset, first mjd], ...]}; the first mjd of a binary header frame
+is None.'''
+def read_index(path):
+    try:
+        with open(path + INDEX_EXTENSION, "r") as f:
+            return json.load(f)
+    except IOError: #no index, e.g. compressed by hand
+        return None
+
+
+'''Decompresses frames first to last (exclusive) of a compressed day file,
+or all of it if it has no index.'''
+def read_frames(path, first = 0, last = None):
+    index = read_index(path)
+    with open(path, "rb") as f:
+        if index is None:
+            return decompress_frames(f.read())
+        frames = index["frames"]
+        last = len(frames) if last is None else last
+        if first >= last:
+            return b""
+        f.seek(frames[first][1])
+        if last < len(frames):
+            return decompress_frames(f.read(frames[last][1] - frames[first][1]))
+        return decompress_frames(f.read())
+
+
+'''Reads a compressed day file. Given a time range, only the frames that
+may hold rows in it are decompressed.
+
+Returns: a (rows, columns) array, [mjd, value, ...] in each row'''
+def read_compressed_day(path, start_mjd = None, end_mjd = None):
+    binary = is_binary(path)
+    index = read_index(path)
+    if index is None or start_mjd is None:
+        data = read_frames(path)
+    else:
+        header_frames = 1 if binary else 0
+        first_mjds = [frame[2] for frame in index["frames"][header_frames:]]
+        first = header_frames + max(0, bisect_right(first_mjds, start_mjd) - 1)
+        last = header_frames + bisect_right(first_mjds, end_mjd)
+        data = read_frames(path, first, last)
+        if binary:
+            data = read_frames(path, 0, 1) + data
+    if binary:
+        return parse_binary(data)[1]
+    return parse_json(data.splitlines())
+
+
+'''Returns the path of the day file of a device for a date, preferring the
+binary file and plain files over compressed ones, or None if there is none.
+
+Params:
+    directory: The device's log directory, e.g. Logging/keithley1
+    mjd: The modified Julian date of the day'''
+def day_path(directory, mjd):
+    for extension in DAY_EXTENSIONS:
+        path = os.path.join(directory, str(int(mjd)) + extension)
+        if os.path.exists(path):
+            return path
+    return None
+
+
+'''Lists the days a device has day files for.
+
+Params:
+    directory: The device's log directory, e.g. Logging/keithley1
+
+Returns: sorted list of modified Julian dates'''
+def list_days(directory):
+    days = set()
+    for filename in os.listdir(directory):
+        if filename.endswith(COMPRESSED_EXTENSION):
+            filename = filename[:-len(COMPRESSED_EXTENSION)]
+        day, extension = os.path.splitext(filename)
+        if extension in (BINARY_EXTENSION, JSON_EXTENSION) and day.isdigit():
+            days.add(int(day))
+    return sorted(days)
+
+
+'''Returns the value column names in the header of a device's newest
+binary day file, or None if it has none. JSON day files do not record them.
+
+Params:
+    directory: The device's log directory, e.g. Logging/keithley1'''
+def known_columns(directory):
+    for day in reversed(list_days(directory)):
+        for extension in (BINARY_EXTENSION, BINARY_EXTENSION + COMPRESSED_EXTENSION):
+            path = os.path.join(directory, str(day) + extension)
+            if os.path.exists(path):
+                return read_header(path)[0]["columns"][1:]
+    return None
+
+
+'''Reads a day file in either format, plain or compressed.
+
+Params:
+    path: The path of the day file
+    start_mjd, end_mjd: Optional time range to return the rows of
+
+Returns: a (rows, columns) array, [mjd, value, ...] in each row'''
+def read_day_file(path, start_mjd = None, end_mjd = None):
+    if path.endswith(COMPRESSED_EXTENSION):
+        rows = read_compressed_day(path, start_mjd, end_mjd)
+    elif path.endswith(BINARY_EXTENSION):
+        rows = read_binary_day(path)[1]
+    else:
+        rows = read_json_day(path)
+    if start_mjd is not None and len(rows):
+        rows = rows[(rows[:, 0] >= start_mjd) & (rows[:, 0] <= end_mjd)]
+    return rows
+
+
+'''Reads the day file of a device for a date, in any format.
+
+Params:
+    directory: The device's log directory, e.g. Logging/keithley1
+    mjd: The modified Julian date of the day
+    start_mjd, end_mjd: Optional time range to return the rows of
+
+Returns: a (rows, columns) array, [mjd, value, ...] in each row; empty if
+    there is no file for that day'''
+def read_day(directory, mjd, start_mjd = None, end_mjd = None):
+    path = day_path(directory, mjd)
+    if path is None:
+        return np.empty((0, 0))
+    return read_day_file(path, start_mjd, end_mjd)
+
+
+'''Replaces a JSON day file with a binary one. The binary file is written
+under a temporary name, checked against the JSON rows and renamed into place
+before the JSON file is removed. Today's file is left alone, since the
+device may still be appending to it.
+
+Params:
+    path: The JSON day file
+    device_type: The device type to record in the header
+    columns: Names of the value columns (default those of the device's newest
+        binary day file if they fit, else value0, value1, ...)
+
+Returns: the path of the binary file
+Raises: ValueError if the day cannot be converted'''
+def convert_day(path, device_type = "", columns = None):
+    directory = os.path.dirname(os.path.abspath(path))
+    day = os.path.splitext(os.path.basename(path))[0]
+    if not day.isdigit() or int(day) >= int(Clock.CLOCK.now()):
+        raise ValueError("ERROR: not converting " + path + ", it is not a past day file")
+    binary_path = os.path.join(directory, day + BINARY_EXTENSION)
+    if os.path.exists(binary_path):
+        raise ValueError("ERROR: not converting " + path + ", " + binary_path + " already exists")
+    rows = read_json_day(path)
+    width = rows.shape[1] - 1 if rows.size else len(columns or [])
+    if columns is None:
+        columns = known_columns(directory)
+        if columns is None or len(columns) != width:
+            columns = ["value" + str(i) for i in range(width)]
+    if len(columns) != width:
+        raise ValueError("ERROR: " + path + " has " + str(width) + " values per row, not " + str(len(columns)))
+    with open(binary_path + ".tmp", "wb") as f:
+        f.write(make_header(os.path.basename(directory), device_type, ["mjd"] + list(columns)))
+        f.write(pack_row(rows))
+    if rows.size and not np.array_equal(read_binary_day(binary_path + ".tmp")[1], rows):
+        os.remove(binary_path + ".tmp")
+        raise ValueError("ERROR: binary copy of " + path + " does not match")
+    os.rename(binary_path + ".tmp", binary_path)
+    os.remove(path)
+    return binary_path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Convert JSON day files to the binary log format")
+    parser.add_argument("files", nargs = "+", help = "JSON day files (.txt)")
+    parser.add_argument("--type", default = "", help = "device type recorded in the header")
+    parser.add_argument("--columns", help = "comma separated names of the value columns")
+    args = parser.parse_args()
+    columns = args.columns.split(",") if args.columns else None
+    for path in args.files:
+        try:
+            print(path + " -> " + convert_day(path, args.type, columns))
+        except ValueError as e:
+            print(e)
@@ -0,0 +1,287 @@
+'''Downsampled copies of a device's log, for plotting long time ranges
+without loading every sample.
+
+Logging/<device>/pyramid/<width>.bin holds one row per bucket of <width>
+seconds (LEVELS), aligned to local midnight like the MJDs of the log (see
+Clock), in the binary format of Log_Format:
+    [bucket start mjd, min..., max..., mean..., count...]
+with one min, max, mean and count per value column. Only finite values are
+aggregated; a bucket without any has count 0 and NaN statistics. The last
+row of each level is the bucket still being filled, rewritten in place as
+samples arrive, so the pyramid is always current.
+
+Usage: python Log_Pyramid.py [--columns a,b,...] Logging/keithley1 rebuilds a
+device's pyramid from its day files.'''
+
+from __future__ import division, print_function
+import argparse
+import os
+import shutil
+import numpy as np
+import Log_Format
+import Log_Reader
+
+LEVELS = [60, 600, 3600, 86400] #bucket widths (sec), finest first
+STATISTICS = ["min", "max", "mean", "count"]
+DIRECTORY_NAME = "pyramid"
+SECONDS_PER_DAY = 86400
+
+
+'''The pyramid of one device, updated as samples are logged. Used by
+Device_Log on the Log_Writer thread.'''
+class Log_Pyramid():
+
+    '''Opens (or creates) the level files and resumes each level's last bucket.
+
+    Params:
+        directory: The device's log directory
+        device_name: The name of the device
+        device_type: The device type, recorded in the headers
+        columns: Names of the value columns'''
+    def __init__(self, directory, device_name, device_type, columns):
+        self.directory = os.path.join(directory, DIRECTORY_NAME)
+        try:
+            os.mkdir(self.directory)
+        except OSError: #directory already exists
+            pass
+        self.columns = list(columns)
+        self.width = len(self.columns)
+        self.row_size = 8*(1 + len(STATISTICS)*self.width)
+        level_columns = ["mjd"] + [statistic + ":" + column for statistic in STATISTICS for column in self.columns]
+        self.files = []
+        self.ends = [] #byte offset after the last row of each level
+        self.buckets = [] #bucket being filled in each level, [id, mins, maxs, sums, counts], or None
+        for seconds in LEVELS:
+            path = level_path(directory, seconds)
+            Log_Format.create_binary(path, device_name, device_type, level_columns)
+            Log_Format.truncate_partial(path) #a row cut short by a crash
+            offset = Log_Format.read_header(path)[1]
+            rows = Log_Format.read_binary_day(path)[1]
+            self.files.append(open(path, "r+b"))
+            self.ends.append(offset + len(rows)*self.row_size)
+            self.buckets.append(self.unpack(np.array(rows[-1]), seconds) if len(rows) else None)
+
+    '''Adds samples to every level.
+
+    Params:
+        times: The MJDs of the samples, in time order
+        values: (samples, columns) array of values'''
+    def add(self, times, values):
+        times = np.asarray(times, dtype=float)
+        values = np.asarray(values, dtype=float).reshape(len(times), self.width)
+        finite = np.isfinite(values)
+        low = np.where(finite, values, np.inf)
+        high = np.where(finite, values, -np.inf)
+        total = np.where(finite, values, 0)
+        count = finite.astype(int)
+        for level, seconds in enumerate(LEVELS):
+            ids = np.floor(times*SECONDS_PER_DAY/seconds).astype(np.int64)
+            bucket = self.buckets[level]
+            if bucket is not None:
+                ids = np.maximum(ids, bucket[0])
+            ids = np.maximum.accumulate(ids) #a sample out of order joins the bucket being filled
+            groups = aggregate(ids, low, high, total, count)
+            position = self.ends[level]
+            if bucket is not None and groups[0][0] == bucket[0]: #still filling the last bucket, rewrite its row
+                groups[1][0] = np.minimum(groups[1][0], bucket[1])
+                groups[2][0] = np.maximum(groups[2][0], bucket[2])
+                groups[3][0] += bucket[3]
+                groups[4][0] += bucket[4]
+                position -= self.row_size
+            self.files[level].seek(position)
+            self.files[level].write(pack(groups, seconds).tobytes())
+            self.ends[level] = position + len(groups[0])*self.row_size
+            self.buckets[level] = [group[-1] for group in groups]
+
+    '''Converts a level row back into a bucket, [id, mins, maxs, sums, counts]'''
+    def unpack(self, row, seconds):
+        mins, maxs, means, counts = row[1:].reshape(len(STATISTICS), self.width)
+        empty = counts == 0
+        return [int(round(row[0]*SECONDS_PER_DAY/seconds)), np.where(empty, np.inf, mins),
+                np.where(empty, -np.inf, maxs), np.where(empty, 0, means*counts), counts.astype(int)]
+
+    '''Flushes the level files to the OS, and to disk if fsync is set'''
+    def flush(self, fsync = False):
+        for f in self.files:
+            f.flush()
+            if fsync:
+                os.fsync(f.fileno())
+
+    '''Flushes and closes the level files'''
+    def close(self):
+        self.flush(True)
+        for f in self.files:
+            f.close()
+        self.files = []
+
+
+'''Groups consecutive samples with the same bucket id.
+
+Params:
+    ids: The bucket id of each sample, non-decreasing
+    low, high, total, count: (samples, columns) arrays of each sample's
+        value, or inf, -inf, 0 and 0 where it is not finite
+
+Returns: the buckets, [ids, mins, maxs, sums, counts]'''
+def aggregate(ids, low, high, total, count):
+    starts = np.flatnonzero(np.concatenate(([True], ids[1:] != ids[:-1])))
+    return [ids[starts], np.minimum.reduceat(low, starts), np.maximum.reduceat(high, starts),
+            np.add.reduceat(total, starts), np.add.reduceat(count, starts)]
+
+
+'''Converts buckets, [ids, mins, maxs, sums, counts], into level rows'''
+def pack(groups, seconds):
+    ids, mins, maxs, sums, counts = groups
+    empty = counts == 0
+    with np.errstate(invalid="ignore", divide="ignore"):
+        means = sums / counts
+    return np.column_stack([ids*seconds/SECONDS_PER_DAY, np.where(empty, np.nan, mins),
+                            np.where(empty, np.nan, maxs), np.where(empty, np.nan, means),
+                            counts]).astype(Log_Format.DTYPE)
+
+
+'''Splits level rows into times, and (rows, columns) arrays of mins, maxs,
+means and counts'''
+def split_rows(rows):
+    mins, maxs, means, counts = np.split(rows[:, 1:], len(STATISTICS), axis=1)
+    return rows[:, 0], mins, maxs, means, counts
+
+
+'''Returns the path of a level file of a device'''
+def level_path(directory, seconds):
+    return os.path.join(directory, DIRECTORY_NAME, str(seconds) + Log_Format.BINARY_EXTENSION)
+
+
+'''Picks the coarsest level that still has a bucket per pixel.
+
+Params:
+    start_mjd, end_mjd: The time range to plot
+    pixels: The width of the plot in pixels
+
+Returns: the bucket width (sec), or 0 if raw samples are needed'''
+def choose_level(start_mjd, end_mjd, pixels):
+    resolution = (end_mjd - start_mjd)*SECONDS_PER_DAY/max(1, pixels)
+    levels = [seconds for seconds in LEVELS if seconds <= resolution]
+    return levels[-1] if levels else 0
+
+
+'''Reads the buckets of one level that overlap a time range.
+
+Returns: times (bucket starts), and (buckets, columns) arrays of mins, maxs,
+    means and counts'''
+def read_level(directory, seconds, start_mjd, end_mjd):
+    rows = Log_Format.read_binary_day(level_path(directory, seconds))[1]
+    first, last = np.searchsorted(rows[:, 0], [start_mjd - seconds/SECONDS_PER_DAY, end_mjd], side="right")
+    return split_rows(np.array(rows[first:last]))
+
+
+'''Reads the raw samples in a time range from the day files, through the
+device's shared Log_Reader, in the same form as read_level (min, max and
+mean are the sample itself)'''
+def read_samples(directory, start_mjd, end_mjd):
+    rows = Log_Reader.get_reader(directory).read(start_mjd, end_mjd)
+    if not len(rows):
+        empty = np.empty((0, 0))
+        return np.empty(0), empty, empty, empty, empty
+    finite = np.isfinite(rows[:, 1:])
+    values = np.where(finite, rows[:, 1:], np.nan)
+    return rows[:, 0], values, values, values, finite.astype(float)
+
+
+'''Reads the raw samples in a time range and buckets them like a level, for
+times a level file does not cover (logged before the pyramid existed).
+
+Returns: times (bucket starts), and (buckets, columns) arrays of mins, maxs,
+    means and counts; None if there are no samples'''
+def read_bucketed_samples(directory, seconds, start_mjd, end_mjd):
+    rows = Log_Reader.get_reader(directory).read(start_mjd, end_mjd)
+    rows = rows[rows[:, 0] < end_mjd] if len(rows) else rows
+    if not len(rows):
+        return None
+    values = rows[:, 1:]
+    finite = np.isfinite(values)
+    ids = np.maximum.accumulate(np.floor(rows[:, 0]*SECONDS_PER_DAY/seconds).astype(np.int64))
+    groups = aggregate(ids, np.where(finite, values, np.inf), np.where(finite, values, -np.inf),
+                       np.where(finite, values, 0), finite.astype(int))
+    return split_rows(pack(groups, seconds))
+
+
+'''Reads a device's log over a time range at the resolution a plot needs:
+the coarsest pyramid level with a bucket per pixel, or the raw samples for
+short ranges (or devices without a pyramid). The part of the range before
+the level's first bucket is bucketed from the raw samples (slow for long
+ranges; rebuild() the pyramid to avoid it).
+
+Params:
+    directory: The device's log directory, e.g. Logging/keithley1
+    start_mjd, end_mjd: The time range
+    pixels: The width of the plot in pixels
+
+Returns: the bucket width (sec, 0 for raw samples), times, and (rows,
+    columns) arrays of mins, maxs, means and counts'''
+def read_range(directory, start_mjd, end_mjd, pixels):
+    seconds = choose_level(start_mjd, end_mjd, pixels)
+    if not seconds or not os.path.exists(level_path(directory, seconds)):
+        return (0,) + read_samples(directory, start_mjd, end_mjd)
+    level = read_level(directory, seconds, start_mjd, end_mjd)
+    first_rows = Log_Format.read_binary_day(level_path(directory, seconds))[1][:1]
+    covered_from = first_rows[0, 0] if len(first_rows) else end_mjd
+    if start_mjd < covered_from:
+        samples = read_bucketed_samples(directory, seconds, start_mjd, min(covered_from, end_mjd))
+        if samples is not None and (not len(level[0]) or samples[1].shape[1] == level[1].shape[1]):
+            level = tuple(np.concatenate(parts) for parts in zip(samples, level))
+    return (seconds,) + level
+
+
+'''Returns the value column names of an existing pyramid, or None'''
+def pyramid_columns(directory):
+    path = level_path(directory, LEVELS[0])
+    if not os.path.exists(path):
+        return None
+    columns = Log_Format.read_header(path)[0]["columns"][1:]
+    return [column.split(":", 1)[1] for column in columns[:len(columns)//len(STATISTICS)]]
+
+
+'''Rebuilds a device's pyramid from all of its day files. JSON day files
+have no column names: they get the given columns, else those of the
+device's binary day files or of the pyramid being replaced, so the live
+log appends to the rebuilt levels rather than moving them aside.
+
+Params:
+    directory: The device's log directory, e.g. Logging/keithley1
+    columns: Names of the value columns of JSON day files (optional)'''
+def rebuild(directory, columns = None):
+    json_columns = columns or Log_Format.known_columns(directory) or pyramid_columns(directory)
+    shutil.rmtree(os.path.join(directory, DIRECTORY_NAME), True)
+    pyramid = None
+    for day in Log_Format.list_days(directory):
+        path = Log_Format.day_path(directory, day)
+        rows = Log_Format.read_day_file(path)
+        if not len(rows):
+            continue
+        if Log_Format.is_binary(path):
+            header = Log_Format.read_header(path)[0]
+            columns = header["columns"][1:]
+            device_name, device_type = header["device"], header["type"]
+        else:
+            width = rows.shape[1] - 1
+            columns = list(json_columns) if json_columns and len(json_columns) == width else \
+                ["value" + str(i) for i in range(width)]
+            device_name, device_type = os.path.basename(os.path.abspath(directory)), ""
+        if pyramid is None or pyramid.columns != columns:
+            if pyramid is not None:
+                pyramid.close()
+            pyramid = Log_Pyramid(directory, device_name, device_type, columns)
+        pyramid.add(rows[:, 0], rows[:, 1:])
+    if pyramid is not None:
+        pyramid.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Rebuild the downsampled log pyramid of devices")
+    parser.add_argument("directories", nargs = "+", help = "device log directories, e.g. Logging/keithley1")
+    parser.add_argument("--columns", help = "comma separated names of the value columns of JSON day files")
+    args = parser.parse_args()
+    for directory in args.directories:
+        rebuild(directory, args.columns.split(",") if args.columns else None)
+        print("Rebuilt " + os.path.join(directory, DIRECTORY_NAME))
@@ -0,0 +1,126 @@
+import os
+import threading
+import numpy as np
+import Log_Format
+
+
+'''Cached reader of a device's day files, shared by the plotters. Each day
+is parsed once; later reads only parse what was appended to the file since
+(whole rows or lines past the remembered byte offset) into arrays that grow
+in place, so a refresh costs in proportion to the new data. A new day file
+after midnight, a file replaced by a compressed one (see Log_Archiver) or
+rewritten with other columns is picked up by itself. Only the days of the
+latest requested range are kept in memory.'''
+class Log_Reader():
+
+    '''Params:
+        directory: The device's log directory, e.g. Logging/keithley1'''
+    def __init__(self, directory):
+        self.directory = directory
+        self.days = {} #mjd -> cached day, see start_day()
+        self.lock = threading.Lock()
+
+    '''Reads the rows in a time range, across as many days as it spans.
+
+    Params:
+        start_mjd, end_mjd: The time range
+
+    Returns: a (rows, columns) array, [mjd, value, ...] in each row; empty
+        if there are none. Do not modify it, it may share the cache.'''
+    def read(self, start_mjd, end_mjd):
+        with self.lock:
+            days = range(int(start_mjd), int(end_mjd) + 1)
+            for day in list(self.days):
+                if day not in days:
+                    del self.days[day]
+            parts = []
+            for day in days:
+                rows = self.update_day(day)
+                if len(rows):
+                    first = np.searchsorted(rows[:, 0], start_mjd, side="left")
+                    last = np.searchsorted(rows[:, 0], end_mjd, side="right")
+                    if last > first:
+                        parts.append(rows[first:last])
+            if not parts:
+                return np.empty((0, 0))
+            return parts[0] if len(parts) == 1 else np.concatenate(parts)
+
+    '''Brings the cache of a day up to date with its file.
+
+    Returns: the day's rows'''
+    def update_day(self, day):
+        path = Log_Format.day_path(self.directory, day)
+        try:
+            status = os.stat(path) if path is not None else None
+        except OSError: #moved between the lookup and now, e.g. compressed
+            status = None
+        if status is None:
+            self.days.pop(day, None)
+            return np.empty((0, 0))
+        cached = self.days.get(day)
+        if (cached is None or cached["path"] != path or cached["inode"] != status.st_ino
+                or status.st_size < cached["offset"]):
+            cached = self.start_day(day, path, status)
+        if status.st_size > cached["offset"] and not path.endswith(Log_Format.COMPRESSED_EXTENSION):
+            with open(path, "rb") as f:
+                f.seek(cached["offset"])
+                data = f.read(status.st_size - cached["offset"])
+            self.append(cached, self.parse(cached, data))
+        return cached["rows"][:cached["count"]]
+
+    '''Starts the cache of a day from scratch. A compressed day is read
+    whole, since it no longer changes.'''
+    def start_day(self, day, path, status):
+        cached = {"path": path, "inode": status.st_ino, "offset": 0, #bytes of the file parsed so far
+                  "rows": np.empty((0, 0)), "count": 0, "header": None}
+        if path.endswith(Log_Format.COMPRESSED_EXTENSION):
+            self.append(cached, Log_Format.read_day_file(path))
+            cached["offset"] = status.st_size
+        self.days[day] = cached
+        return cached
+
+    '''Parses the complete rows (binary) or lines (JSON) at the start of
+    newly appended data, and advances the day's offset past them.'''
+    def parse(self, cached, data):
+        if Log_Format.is_binary(cached["path"]):
+            if cached["header"] is None:
+                header_size = data.find(b"\n") + 1
+                if header_size == 0: #header not written yet
+                    return np.empty((0, 0))
+                cached["header"] = Log_Format.parse_binary(data[:header_size])[0]
+                cached["offset"] += header_size
+                data = data[header_size:]
+            dtype = np.dtype(cached["header"]["dtype"])
+            width = len(cached["header"]["columns"])
+            num_rows = len(data) // (dtype.itemsize*width)
+            cached["offset"] += num_rows*dtype.itemsize*width
+            return np.frombuffer(data, dtype=dtype, count=num_rows*width).reshape(num_rows, width)
+        end = data.rfind(b"\n") + 1 #leave a line still being written for next time
+        cached["offset"] += end
+        return Log_Format.parse_json(data[:end].splitlines())
+
+    '''Appends rows to a day's cache, doubling its capacity when full'''
+    def append(self, cached, rows):
+        if not len(rows):
+            return
+        count = cached["count"]
+        if count + len(rows) > len(cached["rows"]) or cached["rows"].shape[1] != rows.shape[1]:
+            grown = np.empty((max(2*len(cached["rows"]), count + len(rows), 1024), rows.shape[1]))
+            if count:
+                grown[:count] = cached["rows"][:count]
+            cached["rows"] = grown
+        cached["rows"][count:count + len(rows)] = rows
+        cached["count"] = count + len(rows)
+
+
+READERS = {} #directory -> its shared Log_Reader
+READERS_LOCK = threading.Lock()
+
+
+'''Returns the shared Log_Reader of a device's log directory'''
+def get_reader(directory):
+    key = os.path.abspath(directory)
+    with READERS_LOCK:
+        if key not in READERS:
+            READERS[key] = Log_Reader(directory)
+        return READERS[key]
@@ -0,0 +1,103 @@
+import threading
+import time
+import Constants
+
+try:
+    import queue
+except ImportError: #Python 2
+    import Queue as queue
+
+
+'''Background thread that does all log file I/O. Devices hand their entries
+to submit(), which never blocks; this thread drains the queue in batches,
+writes each device's entries with one call to its open day file (see
+Device_Log), and flushes per the policy in Constants:
+    LOG_FLUSH_INTERVAL: flush at most this often (sec), 0 after every batch
+    LOG_FSYNC: also fsync on every flush, so entries survive a power cut
+A slow disk or network mount therefore never delays the control loop.'''
+class Log_Writer(threading.Thread):
+
+    def __init__(self):
+        threading.Thread.__init__(self) #Must call this for the thread to be set up correctly
+        self.queue = queue.Queue(Constants.Constants.LOG_QUEUE_SIZE)
+        self.logs = set() #every Device_Log written so far, to close on stop
+        self.dirty = set() #Device_Logs written since the last flush
+        self.last_flush = time.time()
+        self.start_lock = threading.Lock()
+        self.daemon = True #it will kill automatically, don't have to worry about zombies
+
+    '''Queues one entry of a Device_Log, starting the thread on first use. If
+    the queue is full (the disk has stalled for a long time) the entry is
+    dropped rather than blocking the caller.'''
+    def submit(self, device_log, mjd, values, columns):
+        with self.start_lock:
+            if not self.is_alive() and self.ident is None:
+                self.start()
+        try:
+            self.queue.put_nowait((device_log, mjd, values, columns))
+        except queue.Full:
+            print("ERROR: log queue full, dropped entry of " + device_log.device_name)
+
+    '''Run method for the thread. Waits for entries (or the next flush), then
+    writes everything queued in one batch. Stops on a None entry.'''
+    def run(self):
+        while True:
+            entries = []
+            try:
+                entries.append(self.queue.get(timeout = self.time_to_flush()))
+                while True:
+                    entries.append(self.queue.get_nowait())
+            except queue.Empty:
+                pass
+            stopping = None in entries
+            batches = {} #Device_Log -> its entries, in order
+            for entry in entries:
+                if entry is not None:
+                    batches.setdefault(entry[0], []).append(entry[1:])
+            for device_log, rows in batches.items():
+                self.logs.add(device_log)
+                self.dirty.add(device_log)
+                try:
+                    device_log.write_rows(rows)
+                except Exception as e: #one bad device must not stop logging for the rest
+                    print("ERROR writing log of " + device_log.device_name + ": " + str(e))
+            if stopping or time.time() - self.last_flush >= Constants.Constants.LOG_FLUSH_INTERVAL:
+                self.flush()
+            if stopping:
+                for device_log in self.logs:
+                    try:
+                        device_log.close()
+                    except Exception as e:
+                        print("ERROR closing log of " + device_log.device_name + ": " + str(e))
+                return
+
+    '''Seconds until pending writes are due to be flushed, None if none are'''
+    def time_to_flush(self):
+        if not self.dirty:
+            return None
+        return max(0, self.last_flush + Constants.Constants.LOG_FLUSH_INTERVAL - time.time())
+
+    '''Flushes every day file written since the last flush'''
+    def flush(self):
+        for device_log in self.dirty:
+            try:
+                device_log.flush(Constants.Constants.LOG_FSYNC)
+            except Exception as e:
+                print("ERROR flushing log of " + device_log.device_name + ": " + str(e))
+        self.dirty.clear()
+        self.last_flush = time.time()
+
+    '''Writes out everything queued, closes the day files and stops the thread.
+
+    Params:
+        timeout: How long to wait for the writes (sec)'''
+    def stop(self, timeout = 10):
+        if self.ident is None: #never started, nothing was logged
+            return
+        self.queue.put(None)
+        self.join(timeout)
+        if self.is_alive():
+            print("ERROR: timed out writing the remaining log entries")
+
+
+WRITER = Log_Writer() #shared by all devices
@@ -0,0 +1,53 @@
+import numpy as np
+import threading
+
+
+'''Fixed-size ring buffer of rows (e.g. one row of per-channel readings per
+scan), preallocated as a numpy array. Slots that were never written, and
+channels missing from a row, hold NaN. Safe to append from one thread while
+another reads.'''
+class Ring_Buffer():
+
+    '''Constructor
+
+    Params:
+        depth: The number of rows kept
+        width: The number of columns (channels) in each row'''
+    def __init__(self, depth, width):
+        self.depth = depth
+        self.data = np.full((depth, width), np.nan)
+        self.count = 0 #number of rows ever appended
+        self.lock = threading.Lock()
+
+    '''Returns the number of rows currently held'''
+    def __len__(self):
+        return min(self.count, self.depth)
+
+    '''Appends one row, or a block of rows (oldest first), in one vectorized
+    write. Only the newest depth rows of a block are kept.'''
+    def append(self, rows):
+        rows = np.atleast_2d(rows)[-self.depth:]
+        with self.lock:
+            positions = (self.count + np.arange(len(rows))) % self.depth
+            self.data[positions] = rows
+            self.count += len(rows)
+
+    '''Forgets everything held in some columns (they become NaN)'''
+    def clear(self, columns):
+        with self.lock:
+            self.data[:, columns] = np.nan
+
+    '''Returns a copy of the newest n rows, oldest first'''
+    def latest(self, n = 1):
+        with self.lock:
+            n = min(n, self.count, self.depth)
+            positions = (self.count - n + np.arange(n)) % self.depth
+            return self.data[positions]
+
+    '''Returns the per-column mean of the newest n rows, ignoring NaN. Columns
+    with no readings in those rows are NaN.'''
+    def mean(self, n = 1):
+        rows = self.latest(n)
+        valid = ~np.isnan(rows)
+        with np.errstate(invalid = "ignore", divide = "ignore"):
+            return np.where(valid, rows, 0).sum(axis = 0) / valid.sum(axis = 0)
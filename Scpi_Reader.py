@@ -0,0 +1,156 @@
+import socket
+import time
+
+
+'''Buffered reader for SCPI instruments talking over a TCP socket. Accumulates
+into a preallocated bytearray until the response terminator arrives, so a
+response split over several TCP segments (or larger than one recv) is always
+returned whole. Shared by Keithley_DMM and the old keithley classes.'''
+class Scpi_Reader():
+
+    '''Constructor
+
+    Params:
+        sock: A connected socket to the instrument
+        buffer_size: Initial size of the receive buffer (bytes). Grows if a
+            response does not fit.
+        timeout: How long to wait for a complete response (sec)
+        terminator: The byte sequence that ends a response'''
+    def __init__(self, sock, buffer_size = 2048, timeout = 10, terminator = b"\n"):
+        self.sock = sock
+        self.buffer = bytearray(buffer_size)
+        self.length = 0 #number of valid bytes held in the buffer
+        self.timeout = timeout
+        self.terminator = terminator
+        self.stale = False #set if a response timed out; its tail may still arrive
+        self.partial = b"" #what had arrived of the last response that timed out
+        self.missing = None #bytes of a binary response that timed out still to come, None for a line
+
+    '''Sends a command and returns the response line (see read_line())'''
+    def query(self, command):
+        if self.stale:
+            self.discard_pending()
+        self.partial = b""
+        self.sock.send(command)
+        return self.read_line()
+
+    '''Sends a command and returns exactly count bytes of response (see
+    read_bytes()). Use for binary transfers, which may contain the terminator.'''
+    def query_bytes(self, command, count):
+        if self.stale:
+            self.discard_pending()
+        self.partial = b""
+        self.sock.send(command)
+        return self.read_bytes(count)
+
+    '''Reads one complete response.
+    Returns: the response as bytes, without the terminator
+    Raises: ValueError if the deadline passes before the terminator arrives,
+        socket.error if the connection is closed'''
+    def read_line(self):
+        deadline = time.time() + self.timeout
+        search_start = 0
+        while True:
+            end = self.buffer.find(self.terminator, search_start, self.length)
+            if end >= 0:
+                line = bytes(self.buffer[:end])
+                self.consume(end + len(self.terminator))
+                return line
+            search_start = max(0, self.length - len(self.terminator) + 1)
+            self.receive(deadline)
+
+    '''Reads exactly count bytes, for binary block transfers.
+    Returns: the bytes read'''
+    def read_bytes(self, count):
+        deadline = time.time() + self.timeout
+        while self.length < count:
+            try:
+                self.receive(deadline)
+            except ValueError:
+                self.missing = count - len(self.partial)
+                raise
+        data = bytes(self.buffer[:count])
+        self.consume(count)
+        return data
+
+    '''Receives one chunk from the socket directly into the free part of the
+    buffer, growing the buffer first if it is full.'''
+    def receive(self, deadline):
+        if self.length == len(self.buffer):
+            self.buffer.extend(bytearray(len(self.buffer))) #double the buffer
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            self.fail("ERROR: timed out waiting for response")
+        previous_timeout = self.sock.gettimeout()
+        self.sock.settimeout(remaining)
+        try:
+            received = self.sock.recv_into(memoryview(self.buffer)[self.length:])
+        except socket.timeout:
+            received = None
+        finally:
+            self.sock.settimeout(previous_timeout)
+        if received is None:
+            self.fail("ERROR: timed out waiting for response")
+        if received == 0:
+            self.length = 0
+            raise socket.error("connection closed by instrument")
+        self.length += received
+
+    '''Drops the first count bytes of the buffer, keeping anything received
+    after them (the start of the next response).'''
+    def consume(self, count):
+        leftover = self.length - count
+        if leftover > 0:
+            self.buffer[:leftover] = self.buffer[count:self.length]
+        self.length = leftover
+
+    '''Waits a short time for the rest of a response that timed out (up to
+    its terminator, or its remaining bytes if binary) and throws it away, so
+    the next response read is the next query's.
+
+    Params:
+        timeout: How long to wait for the rest (sec)
+    Returns: whether it arrived; if not, the reader stays stale'''
+    def finish_stale(self, timeout):
+        deadline = time.time() + timeout
+        try:
+            while True:
+                if self.missing is not None and self.length >= self.missing:
+                    self.consume(self.missing)
+                    break
+                end = self.buffer.find(self.terminator, 0, self.length)
+                if self.missing is None and end >= 0:
+                    self.consume(end + len(self.terminator))
+                    break
+                self.receive(deadline)
+        except ValueError: #not yet, fail() has thrown away what did arrive
+            self.missing = None
+            return False
+        self.stale = False
+        self.missing = None
+        return True
+
+    '''Throws away buffered data and anything already waiting on the socket,
+    e.g. the late tail of a response that previously timed out.'''
+    def discard_pending(self):
+        self.length = 0
+        previous_timeout = self.sock.gettimeout()
+        self.sock.setblocking(0)
+        try:
+            while self.sock.recv_into(self.buffer):
+                pass
+        except socket.error:
+            pass #nothing left to read
+        finally:
+            self.sock.settimeout(previous_timeout)
+        self.stale = False
+        self.missing = None
+
+    '''Resets the buffer, keeping what had arrived in self.partial so the
+    caller can salvage it, and raises ValueError with the given message'''
+    def fail(self, message):
+        self.partial = bytes(self.buffer[:self.length])
+        self.length = 0
+        self.stale = True
+        self.missing = None
+        raise ValueError(message)
@@ -2,6 +2,8 @@ import numpy as np
 import Constants
 
 
+FUSION_METHODS = ("mean", "median", "trimmed_mean")
+
 '''Class corresponding to a particular servo loop. You should have no need
 to instantiate this class directly; the Servo_Master class does all of this'''
 class Servo:
@@ -16,6 +18,11 @@ class Servo:
         keithley: The Keithley DMM object whose channels are used in the servo
         input_channels: Either a single channel to read, or a list of channel
             numbers to average their readings
+        input_weights: Optional list of weights of the input channels
+        input_fusion: How readings of several channels are combined: "mean"
+            (weighted, default), "median" (weighted) or "trimmed_mean"
+        input_trim: Fraction of readings dropped from each end by
+            "trimmed_mean" (default 0.25)
         output_device: The object corresponding to the output device
         setpoint: The setpoint of the control variable
         timestep: How often to refresh the control loop (sec)
@@ -25,9 +32,12 @@ class Servo:
         self.params = params
         self.current_reading = -np.inf
         self.previous_reading = -np.inf
+        self.current_time = None #sample time (Unix time) of current_reading
+        self.previous_time = None
         self.integral_value = 0
         self.keithley = input_device
         self.output_device = output_device
+        self.set_inputs(params)
         
         print('Params')
         print(params)
@@ -41,9 +51,54 @@ class Servo:
         setpoint: The setpoint of the control variable
         timestep: How often to refresh the control loop (sec)'''
     def refresh_parameters(self, params):
+        self.set_inputs(params)
         self.params = params
         print("Refreshed parameters for servo " + self.name)
 
+    '''Precomputes the index array of the input channels into the Keithley's
+    readings, and their weights, so each update is a single gather. Checks
+    all the input params first, and changes nothing if they are invalid.
+
+    Params:
+        params: The servo params
+    Raises: ValueError if the input params are invalid'''
+    def set_inputs(self, params):
+        channels = np.atleast_1d(params["input_channel"])
+        indices = self.keithley.channel_indices(channels)
+        weights = np.atleast_1d(np.asarray(params.get("input_weights", 1), dtype=float))
+        if len(weights) == 1:
+            weights = np.repeat(weights, len(channels))
+        if len(weights) != len(channels):
+            raise ValueError("Servo " + self.name + " has " + str(len(weights)) + " input weights for " + str(len(channels)) + " input channels")
+        if params.get("input_fusion", "mean") not in FUSION_METHODS:
+            raise ValueError("Unrecognized input fusion for servo " + self.name + ": " + str(params["input_fusion"]))
+        self.input_indices = indices
+        self.input_weights = weights
+
+    '''Combines the readings of several input channels into one.
+
+    Params:
+        temps: The valid readings
+        weights: Their weights
+        method: One of FUSION_METHODS
+        trim: Fraction of readings dropped from each end by "trimmed_mean"
+
+    Returns: the combined reading'''
+    @staticmethod
+    def fuse_inputs(temps, weights, method = "mean", trim = 0.25):
+        if method == "mean":
+            return np.sum(weights * temps) / np.sum(weights)
+        order = np.argsort(temps)
+        temps = temps[order]
+        weights = weights[order]
+        if method == "median":
+            cumulative = np.cumsum(weights)
+            return temps[np.searchsorted(cumulative, cumulative[-1] / 2.)]
+        n = len(temps) #trimmed_mean
+        dropped = min(int(trim * n), (n - 1) // 2)
+        kept = slice(dropped, n - dropped)
+        return np.sum(weights[kept] * temps[kept]) / np.sum(weights[kept])
+
     '''Clears the accumulated value on the integrator. The main reason you
     would want to call this is in case of severe integrator windup.'''
     def reset_integrator(self):
@@ -54,23 +109,45 @@ class Servo:
     def error_signal(self):
         return self.params["setpoint"] - self.current_reading
 
-    '''Calculates and returns the output signal'''
-    def output_signal(self):
+    '''Calculates and returns the output signal
+
+    Params:
+        dt: Time between the previous and the current reading (sec)'''
+    def output_signal(self, dt):
         error = self.error_signal()
         k = self.params["k"]
         prop = k * error
         integral = k * self.integral_value
-        diff = k * (self.current_reading - self.previous_reading) * self.params["t_diff"]/Constants.Constants.BASE_TICK_INTERVAL
+        diff = k * (self.current_reading - self.previous_reading) * self.params["t_diff"]/dt
         return prop+integral+diff
 
     '''Performs one iteration of the servo loop.'''
     def update(self):
+        temps = self.keithley.get_temps(self.input_indices)
+        ages = self.keithley.get_ages(self.input_indices)
+        fresh = ages <= self.params.get("max_age", Constants.Constants.MAX_READING_AGE)
+        if not fresh.any():
+            print("Holding output of servo " + self.name + ": input reading is " + str(np.min(ages)) + " s old")
+            return
+        valid = fresh & np.isfinite(temps) #drops stale and open-circuit channels
+        sample_time = np.mean(self.keithley.get_sample_times(self.input_indices)[fresh])
+        if self.current_time is not None and sample_time <= self.current_time:
+            print("Holding output of servo " + self.name + ": no new input reading")
+            return
         self.previous_reading = self.current_reading
-        self.current_reading = self.keithley.get_temp(self.params["input_channel"])
+        self.previous_time = self.current_time
+        self.current_time = sample_time
+        if valid.any():
+            self.current_reading = self.fuse_inputs(temps[valid], self.input_weights[valid],
+                                                    self.params.get("input_fusion", "mean"),
+                                                    self.params.get("input_trim", 0.25))
+        else:
+            self.current_reading = -np.inf
         print('Current reading (C) for ' + str(self.name) + ' ' + str(self.current_reading))
         if (self.previous_reading != -np.inf and self.current_reading != -np.inf): #Avoid error on startup
-            self.integral_value += self.error_signal() * Constants.Constants.BASE_TICK_INTERVAL / self.params["t_int"]
-            output_signal = self.output_signal()
+            dt = self.current_time - self.previous_time #true time between the samples
+            self.integral_value += self.error_signal() * dt / self.params["t_int"]
+            output_signal = self.output_signal(dt)
             output = float(output_signal) + float(self.params.get("output_default", 0))
             control_var = min(max(output, self.params.get("output_min", -np.inf)), self.params.get("output_max", np.inf))
             if control_var != output:
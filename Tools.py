@@ -1,22 +1,21 @@
-import astropy
-from datetime import datetime
 import os
 import numpy as np
+import Clock
+from Channel_Map import Channel_Map
 
 
 
 DIRECTORY = os.getcwd() #We want to save our current directory!
+DEFAULT_CHANNEL_MAP = Channel_Map()
 
 
 '''Class containing various utility functions'''
 class Tools:
 
-    '''Helper function that gets and returns a string representation of the Julian date/time'''
+    '''Returns the current modified Julian date, from the shared Clock'''
     @staticmethod
     def get_modified_julian_date():
-        t = astropy.time.Time(datetime.now())
-        t.format = "mjd"
-        return float(str(t))
+        return Clock.CLOCK.now()
 
     '''Auxiliary function for converting int to bytes'''
     @staticmethod
@@ -35,21 +34,25 @@ class Tools:
     def resistance_to_temp(resistance, resistance_25C, beta):
         return 1 / (1 / (25 + 273.15) + np.log(resistance / resistance_25C) / beta) - 273.15
 
-    '''Converts an entire array of resistances to temperature. Properly handles
-    infinite resistances and unconfigured channels
+    '''Converts an entire array of resistances to temperature in one vectorized
+    expression. Properly handles infinite resistances and unconfigured channels.
+    Keithley_DMM uses the precompiled equivalent in Calibration.
         Params:
         resistances: The measured resistance (ohms)
         resistances_25C: The thermistor resistance at 25C (ohms)
         beta: The thermistor beta coefficient
+        offset: Constant cable resistance to subtract (ohms)
 
     Returns: measured temperature in degrees C as an array'''
     @staticmethod
-    def resistance_to_temp_array(resistances, resistances_25C, beta):
-        temps = np.full(len(resistances), -np.inf) #Filled with minus infinities
-        for i in range(len(resistances)):
-            if resistances[i] != np.inf and resistances_25C[i] != np.inf and beta[i] != 0:
-                temps[i] = Tools.resistance_to_temp(resistances[i], resistances_25C[i], beta[i])
-        return temps
+    def resistance_to_temp_array(resistances, resistances_25C, beta, offset = 0):
+        resistances = np.asarray(resistances, dtype = float) - offset
+        resistances_25C = np.asarray(resistances_25C, dtype = float)
+        beta = np.asarray(beta, dtype = float)
+        valid = np.isfinite(resistances) & (resistances > 0) & np.isfinite(resistances_25C) & (beta != 0)
+        with np.errstate(divide = "ignore", invalid = "ignore"):
+            temps = Tools.resistance_to_temp(resistances, resistances_25C, beta)
+        return np.where(valid, temps, -np.inf)
 
     '''Returns the time a file was last modified'''
     @staticmethod
@@ -57,22 +60,12 @@ class Tools:
         return os.stat(filename)[8] #just trust me this works
 
     '''Converts channel number 101-120 and 201-220 into indices in the array
-    of data returned. For Keithley'''
+    of data returned. For Keithley with the default cards, see Channel_Map'''
     @staticmethod
     def channel_number_to_array_index(channel_number):
-        if 101 <= channel_number <= 120:
-            return int(channel_number-101)
-        elif 201 <= channel_number <= 220:
-            return int(channel_number-181)
-        else:
-            raise ValueError("ERROR: Invalid channel number " + str(channel_number))
+        return DEFAULT_CHANNEL_MAP.index(channel_number)
 
     '''Converts array index in data received from Keithley to its channel number.'''
     @staticmethod
     def array_index_to_channel_number(index):
-        if 0 <= index < 20:
-            return index + 101
-        elif 20 <= index < 40:
-            return index + 181
-        else:
-            raise ValueError("ERROR: Invalid array index " + str(index))
+        return DEFAULT_CHANNEL_MAP.channel(index)
@@ -0,0 +1,93 @@
+'''Benchmark for Keithley acquisition against the local 2701 emulator
+(Keithley_Emulator.py). Reports scans/sec, parse time and end-to-end latency
+of Keithley_DMM.read(), so acquisition changes can be measured on a laptop.
+
+Usage: python benchmark_acquisition.py [--scans 50] [--channels 40]
+    [--data-format ascii|real] [--acquisition blocking|pipelined]
+    [--reading-delay 0.001] [--fragment 0.5] [--drop 0] [--truncate 0]'''
+
+from __future__ import division, print_function
+import argparse
+import os
+import tempfile
+import time
+import numpy as np
+
+#Keithley_DMM logs into the current directory; keep benchmark logs out of the way
+os.chdir(tempfile.mkdtemp())
+os.mkdir("Logging")
+
+from Keithley_Emulator import Keithley_Emulator, Keithley_Emulator_State
+from Keithley_DMM import Keithley_DMM
+
+
+'''Times fn over repeats calls. Returns the per-call times (sec) as an array'''
+def time_calls(fn, repeats):
+    times = np.empty(repeats)
+    for i in range(repeats):
+        start = time.time()
+        fn()
+        times[i] = time.time() - start
+    return times
+
+
+'''Formats per-call times as mean / median / 95th percentile in ms'''
+def summarize(times):
+    return "mean %.3f ms, median %.3f ms, p95 %.3f ms" % (
+        1000*np.mean(times), 1000*np.median(times), 1000*np.percentile(times, 95))
+
+
+def main():
+    parser = argparse.ArgumentParser(description = "Benchmark Keithley_DMM acquisition")
+    parser.add_argument("--scans", type = int, default = 50)
+    parser.add_argument("--channels", type = int, default = 40,
+                        help = "number of configured channels (1-40)")
+    parser.add_argument("--data-format", default = "ascii", choices = ["ascii", "real"])
+    parser.add_argument("--acquisition", default = "blocking", choices = ["blocking", "pipelined"])
+    parser.add_argument("--reading-delay", type = float, default = 0.001,
+                        help = "emulated seconds per reading (default 1 ms)")
+    parser.add_argument("--fragment", type = float, default = 0,
+                        help = "probability a response arrives in fragments")
+    parser.add_argument("--drop", type = float, default = 0,
+                        help = "probability the emulator drops the connection")
+    parser.add_argument("--truncate", type = float, default = 0,
+                        help = "probability a response stops part way")
+    args = parser.parse_args()
+
+    emulator = Keithley_Emulator(0, reading_delay = args.reading_delay,
+                                 fragment_probability = args.fragment, drop_probability = args.drop,
+                                 truncate_probability = args.truncate)
+    emulator.start()
+    keithley = Keithley_DMM("Benchmark Keithley", {"address": "127.0.0.1", "port": emulator.port,
+                                                   "data_format": args.data_format,
+                                                   "acquisition": args.acquisition})
+    for index in range(args.channels):
+        keithley.configure_channel(keithley.channel_map.channel(index),
+                                   {"name": "ch" + str(index), "resistance_25c": 10000, "beta": 3900})
+    keithley.read() #first read pushes the scan session
+
+    latencies = time_calls(keithley.read, args.scans)
+    print("%d scans of %d channels (%s, %s)" % (args.scans, args.channels, args.data_format, args.acquisition))
+    print("Scans/sec: %.1f" % (args.scans/np.sum(latencies)))
+    print("read() latency: " + summarize(latencies))
+
+    #Parse cost alone, on a response captured from a fresh emulator state
+    state = Keithley_Emulator_State(emulator.state.waveforms, args.reading_delay)
+    state.route = list(keithley.scan_route)
+    state.sample_count = len(state.route)
+    readings, _ = state.take_readings(time.time())
+    if args.data_format == "real":
+        state.data_format = "DREAL"
+        state.byte_order = "SWAP"
+        payload = state.format_readings(readings)
+        parse_times = time_calls(lambda: Keithley_DMM.parse_real_data(payload, len(readings)), 1000)
+    else:
+        text = state.format_readings(readings).decode("ascii")
+        parse_times = time_calls(lambda: Keithley_DMM.parse_ascii_data(text, len(readings)), 1000)
+    print("Parse time: " + summarize(parse_times))
+    keithley.close()
+    emulator.shutdown()
+
+
+if __name__ == "__main__":
+    main()
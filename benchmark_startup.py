@@ -0,0 +1,67 @@
+'''Startup benchmark for the control loop. Imports main.py in fresh
+interpreters, reports the import time, and fails if it exceeds the limit or
+if a heavy dependency that should only load on demand (astropy, pyserial,
+matplotlib) was imported.
+
+Usage: python benchmark_startup.py [--repeats 5] [--limit 1.0]'''
+
+from __future__ import division, print_function
+import argparse
+import json
+import os
+import subprocess
+import sys
+import numpy as np
+
+HEAVY_MODULES = ["astropy", "serial", "matplotlib", "PyQt5"]
+
+#Run in the child interpreter: time "import main", then list heavy modules
+CHILD = '''
+import json, sys, time
+start = time.time()
+import main
+elapsed = time.time() - start
+heavy = [m for m in %r if m in sys.modules]
+print(json.dumps([elapsed, heavy]))
+''' % HEAVY_MODULES
+
+
+'''Imports main in a fresh interpreter. Returns (seconds, heavy modules loaded)'''
+def time_import(directory):
+    output = subprocess.check_output([sys.executable, "-c", CHILD], cwd = directory)
+    elapsed, heavy = json.loads(output.decode("ascii").strip().splitlines()[-1])
+    return elapsed, heavy
+
+
+def main():
+    parser = argparse.ArgumentParser(description = "Benchmark control loop import time")
+    parser.add_argument("--repeats", type = int, default = 5)
+    parser.add_argument("--limit", type = float, default = 1.0,
+                        help = "maximum allowed median import time (sec)")
+    args = parser.parse_args()
+
+    directory = os.path.dirname(os.path.abspath(__file__))
+    times = []
+    heavy = set()
+    for i in range(args.repeats):
+        elapsed, loaded = time_import(directory)
+        times.append(elapsed)
+        heavy.update(loaded)
+    median = np.median(times)
+    print("import main: median %.3f s, min %.3f s, max %.3f s over %d runs" % (
+        median, min(times), max(times), args.repeats))
+
+    failed = False
+    if heavy:
+        print("FAIL: heavy modules imported at startup: " + ", ".join(sorted(heavy)))
+        failed = True
+    if median > args.limit:
+        print("FAIL: median import time above limit of %.3f s" % args.limit)
+        failed = True
+    if not failed:
+        print("OK")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -11,20 +11,16 @@ import numpy as np
 import time
 import threading
 import os
-from datetime import datetime
-import socket
-import serial
-import struct
-import json
-import astropy.time
-from Chiller import Chiller
-from Keithley_DMM import Keithley_DMM
 from Tools import Tools
 from Servo import Servo
 from Aux_Timer import Aux_Timer
+from Line_Tokenizer import LineTokenizer
+import Drivers
 import sys
-from rigol_dp832a import rigol_dp832a
 import Constants
+import Clock
+import Log_Writer
+from Log_Archiver import Log_Archiver
 
 #flush buffer for disown script to get it write to file
 sys.stdout.flush()
@@ -49,6 +45,12 @@ class Servo_Master():
         self.file_last_modified = Tools.when_last_modified(config_filename)
         self.servos = {}
         self.devices = {}
+        self.acquisition_threads = {} #device name -> thread reading that device
+        self.startup_threads = {} #device name -> thread constructing that device, until its result is collected
+        self.started_devices = {} #device name -> device created by its startup thread
+        self.startup_errors = {} #device name -> why its startup thread failed
+        self.failed_devices = set() #devices not up (failed or still starting), their sections are skipped
+        self.config_lines = [] #(title, tokens) of the config file last parsed
         self.current_device = "" #ignore, for implementation only
         self.parse_config_file(config_filename)
         self.clock_flag = threading.Event()
@@ -56,9 +58,10 @@ class Servo_Master():
                                self.clock_flag)
         print("Servos initialized")
 
-    '''Refreshes by rereading from file.'''
+    '''Refreshes by rereading from file. New and failed devices are started
+    in the background, see adopt_started_devices().'''
     def refresh(self):
-        self.parse_config_file(self.config_filename)
+        self.parse_config_file(self.config_filename, False)
 
     '''Returns whether the config file has changed since last refresh.'''
     def config_file_has_changed(self):
@@ -69,9 +72,16 @@ class Servo_Master():
             return True
         return False
 
-    '''Parses the config file to set up instruments and servo loops'''
-    def parse_config_file(self, config_filename):
+    '''Parses the config file to set up instruments and servo loops. All
+    devices are created first, concurrently, then channels and servos are
+    configured in file order.
+
+    Params:
+        config_filename: The filename/path to find the config file
+        wait: Whether to wait for the devices to come up (see create_devices)'''
+    def parse_config_file(self, config_filename, wait = True):
         title = ""
+        lines = [] #(title, tokens)
         with open(config_filename) as f:
             for line in f:
                 tokens = self.tokenize_line(line)
@@ -79,7 +89,46 @@ class Servo_Master():
                     title = tokens[0]
                 else:
                     if title and tokens:
-                        self.interpret_tokens(tokens, title)
+                        lines.append((title, tokens))
+        self.config_lines = lines
+        self.create_devices([tokens for title, tokens in lines if title == "devices"], wait)
+        self.configure(lines)
+
+    '''Configures channels and servos of the devices that are up, in file order.
+
+    Params:
+        lines: (title, tokens) of the config file
+        device_names: If given, only the channels of these devices and the
+            servos that use them are configured, leaving the others untouched'''
+    def configure(self, lines, device_names = None):
+        for title, tokens in lines:
+            if title == "devices":
+                continue
+            if device_names is not None and not self.uses_devices(title, tokens, device_names):
+                continue
+            self.interpret_tokens(tokens, title)
+        self.mark_servo_inputs()
+
+    '''Returns whether a config line configures one of some devices: a
+    channel of one, or a servo reading or driving one'''
+    def uses_devices(self, title, tokens, device_names):
+        if title != "servos":
+            return title in device_names
+        try:
+            params = self.pair_tokens(tokens)[1]
+        except ValueError:
+            return False
+        return params.get("input_device") in device_names or params.get("output_device") in device_names
+
+    '''Marks on each Keithley exactly the channels its servos read, so a
+    channel no longer used by any servo goes back to its own scan rate.'''
+    def mark_servo_inputs(self):
+        for device in list(self.devices.values()):
+            if hasattr(device, "clear_servo_inputs"):
+                device.clear_servo_inputs()
+        for servo in self.servos.values():
+            if hasattr(servo.keithley, "set_servo_input"):
+                servo.keithley.set_servo_input(servo.params["input_channel"])
 
     '''Tokenizes line from the config file'''
     def tokenize_line(self, line):
@@ -94,11 +143,13 @@ class Servo_Master():
         if not title:
             raise ValueError("ERROR: No title")
         elif title == "devices":
-            self.create_device_from_tokens(tokens)
+            self.create_devices([tokens])
         elif title == "channels":
             pass
         elif title in self.devices:
             self.configure_channel_from_tokens(tokens, title)
+        elif title in self.failed_devices:
+            pass #already reported in the startup report
         elif title == "servos":
             self.configure_servo_from_tokens(tokens)
 
@@ -106,51 +157,118 @@ class Servo_Master():
             raise ValueError("ERROR: Invalid title in config file: " + title)
 
 
-    '''Configures a device from tokens extracted from the config file.
+    '''Creates a device from tokens extracted from the config file.
     Prints an error message but does not propagate exceptions if device
     configuration fails.
 
     Params:
-        tokens: Tokens from the config file'''
+        tokens: Tokens from the config file
+    Returns: the device, or None if its config is invalid'''
     def create_device_from_tokens(self, tokens):
         name = tokens[0].strip(":")
-        if name in self.devices: #Check if we already have the device
-            return #We already have the device initialized
-        #Either the device hasn't been initialized yet, or has changed
-
         try:
             _, params = self.pair_tokens(tokens)
         except ValueError:
             print("Error: unable to configure device " + tokens[0] + " due to incorrect number of tokens")
-            return
+            return None
 
         if "type" not in params:
             print("Error: device missing parameter 'type'")
-            return
+            return None
 
-        if params["type"] == "rigol_dp832a":
-            try:
-                self.devices[name] = rigol_dp832a(name, params)
-            except Exception as e:
-                print("ERROR: Unable to initialize Rigol: " + name)
-                raise(e)
+        driver = Drivers.get_driver(params["type"]) #raises ValueError if unrecognized
+        try:
+            return driver(name, params)
+        except Exception as e:
+            print("ERROR: Unable to initialize " + params["type"] + ": " + name)
+            raise(e)
 
-        elif params["type"] == "chiller":
-            try:
-                self.devices[name] = Chiller(name, params)
-            except Exception as e:
-                print("ERROR: Unable to initialize chiller: " + name)
-                raise(e)
-        elif params["type"] == "keithley":
-            try:
-                self.devices[name] = Keithley_DMM(name, params)
-            finally:
-                pass #TODO
-#            except Exception as e:
-#                print("ERROR: Unable to initialize Keithley: " + name)
-#                raise(e)
-        else: #We have an unrecognized device type:
-            raise ValueError("Unrecognized device type")
+    '''Creates devices concurrently, one thread per device, so startup takes
+    as long as the slowest device rather than the sum of all of them. Devices
+    not up yet are left out (and their config sections skipped); each comes
+    up on its own thread, bounded by its driver's connect and handshake
+    timeouts, and is adopted by adopt_started_devices().
+
+    Params:
+        device_tokens: List of tokens of the lines in the devices section
+        wait: Whether to wait, at most Constants.DEVICE_STARTUP_TIMEOUT, and
+            print a report of which devices came up. The control loop never
+            waits: it retries failed devices in the background.'''
+    def create_devices(self, device_tokens, wait = True):
+        start_time = time.time()
+        started = []
+        for tokens in device_tokens:
+            name = tokens[0].strip(":")
+            if name in self.devices:
+                continue
+            thread = self.startup_threads.get(name)
+            if thread is not None and thread.is_alive():
+                print("ERROR: device " + name + " is still starting up from a previous attempt")
+                continue
+            self.failed_devices.add(name) #until it is up
+            thread = threading.Thread(target=self.start_device, args=(name, tokens))
+            thread.daemon = True #don't let a hung instrument block exit
+            thread.start()
+            self.startup_threads[name] = thread
+            started.append(name)
+        if not started or not wait:
+            return
+        deadline = start_time + Constants.Constants.DEVICE_STARTUP_TIMEOUT
+        for name in started:
+            self.startup_threads[name].join(max(0, deadline - time.time()))
+        report = self.collect_started_devices()[0]
+        for name in started:
+            if name in self.startup_threads:
+                report.append(name + ": TIMED OUT after " + str(Constants.Constants.DEVICE_STARTUP_TIMEOUT)
+                              + " s, still starting in the background")
+        print("Device startup report (%.1f s):" % (time.time() - start_time))
+        for line in report:
+            print("    " + line)
+
+    '''Thread target of create_devices: creates one device, recording the
+    device, or the error if it fails'''
+    def start_device(self, name, tokens):
+        try:
+            device = self.create_device_from_tokens(tokens)
+            if device is not None:
+                self.started_devices[name] = device
+        except Exception as e:
+            self.startup_errors[name] = e
+
+    '''Adds the devices whose startup threads have finished to the running
+    devices, on the control loop's thread.
+
+    Returns: a report line per finished device, and the names of those that came up'''
+    def collect_started_devices(self):
+        report = []
+        came_up = []
+        for name, thread in list(self.startup_threads.items()):
+            if thread.is_alive():
+                continue
+            del self.startup_threads[name]
+            device = self.started_devices.pop(name, None)
+            error = self.startup_errors.pop(name, "not created")
+            if device is not None:
+                self.devices[name] = device
+                self.failed_devices.discard(name)
+                came_up.append(name)
+                report.append(name + ": up")
+            else:
+                report.append(name + ": FAILED (" + str(error) + ")")
+        return report, came_up
+
+    '''Called every tick: adopts devices that came up in the background since
+    the last tick and configures their channels and the servos that use them,
+    without waiting for devices still starting. Other devices and servos are
+    left running as they are.'''
+    def adopt_started_devices(self):
+        report, came_up = self.collect_started_devices()
+        if report:
+            print("Device startup report:")
+            for line in report:
+                print("    " + line)
+        if came_up:
+            self.configure(self.config_lines, came_up)
 
     '''Configures a channel from tokens extracted from the config file.
     Prints an error message but does not propagate exceptions.
@@ -162,11 +280,15 @@ class Servo_Master():
             channel_number, params = self.pair_tokens(tokens)
         except ValueError:
             print("Error: unable to configure channel " + tokens[0] + " due to incorrect number of tokens")
+            return
 
         if not device_name in self.devices:
             raise ValueError("Unrecognized device name: " + device_name)
 
-        self.devices[device_name].configure_channel(channel_number, params)
+        try:
+            self.devices[device_name].configure_channel(channel_number, params)
+        except (ValueError, TypeError) as e: #keeps the previous channel config
+            print("ERROR: unable to configure channel " + tokens[0] + " of " + device_name + ": " + str(e))
 
     '''Pairs tokens into dictionary. Returns the name/channel number before the colon, followed by a dict of parameters'''
     def pair_tokens(self, tokens):
@@ -177,12 +299,10 @@ class Servo_Master():
         for i in range(num_params):
             parameter_name = tokens[1 + 2*i]
             parameter_value_string = tokens[2 + 2*i]
-            try: #convert strings to literal number, see if it works
-                parameter_value = float(parameter_value_string)
-                if parameter_value == int(parameter_value):
-                    parameter_value = int(parameter_value)
-            except ValueError as e:
-                parameter_value = parameter_value_string
+            if isinstance(parameter_value_string, list): #bracketed list, e.g. of channels
+                parameter_value = [self.parse_value(s) for s in parameter_value_string]
+            else:
+                parameter_value = self.parse_value(parameter_value_string)
             params[parameter_name] = parameter_value
 
         header_string = tokens[0].strip(":")
@@ -192,6 +312,16 @@ class Servo_Master():
             header = header_string
         return header, params
 
+    '''Converts a parameter string to an int or float if it is a number'''
+    def parse_value(self, parameter_value_string):
+        try: #convert strings to literal number, see if it works
+            parameter_value = float(parameter_value_string)
+            if parameter_value == int(parameter_value):
+                parameter_value = int(parameter_value)
+        except ValueError as e:
+            parameter_value = parameter_value_string
+        return parameter_value
+
 
     '''Configures a servo loop from tokens extracted from the config file.
     Prints an error message but does not propagate exceptions if a servo loop
@@ -204,7 +334,8 @@ class Servo_Master():
         try:
             servo_name, params = self.pair_tokens(tokens)
         except ValueError:
-            print("ERROR: unable to configure servo " + servo_name + " due to even number of tokens")
+            print("ERROR: unable to configure servo " + tokens[0] + " due to even number of tokens")
+            return
 
         #Check if required parameters are present
         for required_parameter in ["input_device", "output_device", "setpoint", "k", "t_int", "t_diff"]:
@@ -217,18 +348,25 @@ class Servo_Master():
             print("Error: unrecognized input device name: " + params["input_device"])
         elif params["output_device"] not in self.devices:
             print("Error: unrecognized output device name: " + params["output_device"])
-        elif servo_name in self.servos and params["input_device"] == self.servos[servo_name].keithley and params["output_device"] == self.servos[servo_name].output_device:
-            self.servos[servo_name].refresh_parameters(params)
         else:
-            input_device = self.devices[params["input_device"]]
-            output_device = self.devices[params["output_device"]]
-            self.servos[servo_name] = Servo(servo_name, params, self, input_device, output_device)
+            try:
+                if servo_name in self.servos and params["input_device"] == self.servos[servo_name].keithley.name and params["output_device"] == self.servos[servo_name].output_device.name:
+                    self.servos[servo_name].refresh_parameters(params)
+                else:
+                    input_device = self.devices[params["input_device"]]
+                    output_device = self.devices[params["output_device"]]
+                    self.servos[servo_name] = Servo(servo_name, params, self, input_device, output_device)
+            except ValueError as e: #keeps the previous servo, if any
+                print("ERROR: unable to configure servo " + servo_name + ": " + str(e))
 
 
     '''Starts and runs the servo loops.'''
     def start(self):
         print("Starting logging and servo loops")
         self.timer.start()
+        archiver = Log_Archiver()
+        if Constants.Constants.ARCHIVE_AFTER_DAYS > 0:
+            archiver.start()
         try:
             self.run()
         finally: #Clean up resources
@@ -236,6 +374,8 @@ class Servo_Master():
             for device in self.devices.values():
                 device.close()
                 print("Closed device: " + device.name)
+            Log_Writer.WRITER.stop() #write out the queued log entries
+            archiver.stop()
             print("Program exited")
 
     '''Updates the servo loops operated by the servo master object.'''
@@ -254,6 +394,30 @@ class Servo_Master():
                 device.log()
         print("Logged all devices")
 
+    '''Reads all Keithleys concurrently, one thread per device, so a tick costs
+    the slowest scan rather than the sum of all of them. Waits at most
+    Constants.ACQUISITION_TIMEOUT; a device that has not answered by then keeps
+    its previous readings, and is not read again until its thread finishes.'''
+    def read_devices(self):
+        started = []
+        for device in self.devices.values():
+            if device.type == "keithley":
+                thread = self.acquisition_threads.get(device.name)
+                if thread is not None and thread.is_alive():
+                    print("ERROR: previous read of " + device.name + " still in progress")
+                    continue
+                thread = threading.Thread(target=device.read)
+                thread.daemon = True #don't let a hung instrument block exit
+                thread.start()
+                self.acquisition_threads[device.name] = thread
+                started.append(device.name)
+        deadline = time.time() + Constants.Constants.ACQUISITION_TIMEOUT
+        for name in started:
+            thread = self.acquisition_threads[name]
+            thread.join(max(0, deadline - time.time()))
+            if thread.is_alive():
+                print("ERROR: timed out reading " + name + ", using previous readings")
+
     '''Main infinite loop that runs the servo loop. Called by start() in new
     thread.'''
     def run(self):
@@ -266,17 +430,17 @@ class Servo_Master():
                     self.clock_flag.wait(1) #1 second timeout to catch KeyboardInterrupt
                 print("Time: ", time.time() - start_time)
                 self.clock_flag.clear() #Reset the event flag to False
+                Clock.CLOCK.tick() #one timestamp for everything logged this tick
+                self.read_devices() #first, so pipelined scans integrate during the rest of the tick
                 self.update_servos()
                 if logging_count == 0:
                     self.log_all()
                 logging_count = (logging_count + 1) % logging_freq
+                self.adopt_started_devices()
                 if self.config_file_has_changed():
                     print("Config file changed")
                     self.refresh()
                     print("Loop parameters updated successfully.")
-                for device in self.devices.values():
-                    if isinstance(device, Keithley_DMM):
-                        device.read()
         finally: #called to clean up devices and servos
             '''for servo in self.servos.values():
                 servo.close()
@@ -284,54 +448,6 @@ class Servo_Master():
                 device.close()''' #TODO fix
 
 
-class LineTokenizer:
-
-        '''Parses a line of the file into useful tokens. A complicated function
-        that more or less takes in a line from the config file and breaks it into
-        parts the rest of the program understands. Deletes comments, whitespace.
-
-        Params:
-            line: A line of text from the config file
-        Returns: A list of arguments contained in the line.
-        If the line is invalid or pure whitespace, returns an empty list.'''
-        @staticmethod
-        def tokenize_line(line):
-            if line is None:
-                return []
-            line = line.strip().lower().replace("=", " ").replace(":", " ").replace(",", " ")
-            if line == "":
-                return [] #our line is pure whitespace
-            hash_position = line.find('#')
-            if hash_position == 0:
-                return [] #pure comment
-            elif hash_position > 0: #there is a hash, but it isn't first character
-                line = line[:hash_position]
-            raw_tokens = line.split() #use first pass with Python's tokenizer, then clean up
-            tokens = []
-            in_quote = False
-            current_token = ""
-            current_list = []
-            for token in raw_tokens: #this is all quote mark, equals, and bracket handling!
-                if in_quote:
-                    if token[-1] == '"':
-                        in_quote = False
-                        tokens.append(current_token + " " + token[:-1])
-                        current_token = ""
-                    else:
-                        current_token += (" " + token)
-                else:
-                    if token[0] == '"':
-                        if token[-1] == '"':
-                            tokens.append(token[1:-1])
-                        else:
-                            in_quote = True
-                            current_token = token[1:]
-                    else:
-                        tokens.append(token)
-            return tokens
-
-
-
 if __name__ == "__main__":
     master = Servo_Master("config_blues.txt")
     master.start()
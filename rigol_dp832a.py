@@ -5,12 +5,9 @@ import socket
 import time
 import numpy as np
 import time
-from Tools import Tools
-import os
-import json
 import Constants
-
-DIRECTORY = os.getcwd() #We want to save our current directory!
+import Clock
+from Device_Log import Device_Log
 
 
 
@@ -23,7 +20,8 @@ class rigol_dp832a():
 
     Params:
         name: The name of the chiller
-        params: Parameter dictionary for initializing Rigol. Must contain "address" parameter with ip address
+        params: Parameter dictionary for initializing Rigol. Must contain "address" parameter with ip address.
+            "log_format" and "log_pyramid" set up logging, see Device_Log
         log_file: The filename to log the chiller'''
 
 
@@ -39,8 +37,7 @@ class rigol_dp832a():
         self.port = 5555 #default Rigol, not 100 percent sure
         self.ip_address = params["address"]
 
-        self.current_modified_julian_date = int(Tools.get_modified_julian_date())
-        self.create_log_file()
+        self.device_log = Device_Log(self.name, self.type, params)
 
         print("Device initialized: " + name)
 
@@ -48,17 +45,6 @@ class rigol_dp832a():
     def configure_channel(self, channel_number, params):
         pass #TODO this could be implemented later if necessary. For now there's nothing to set but names...
 
-    '''Creates log file for the device'''
-    def create_log_file(self):
-        log_file_directory = DIRECTORY+"/Logging/"+self.name.replace(" ","")
-        try:
-            os.mkdir(log_file_directory)
-        except OSError: #directory already exists
-            pass
-        self.log_file = log_file_directory + "/" + str(self.current_modified_julian_date) + ".txt"
-        with open(self.log_file, "a"):
-            pass #Just create the file
-        print("Created log file for device " + self.name)
 
 
 
@@ -122,10 +108,5 @@ class rigol_dp832a():
 
     '''Logs the setpoints of the Rigol, as array [MJD, [ch1, ch2, ch3]]'''
     def log(self):
-        if not int(Tools.get_modified_julian_date()) == self.current_modified_julian_date:
-            #we crossed midnight
-            self.current_modified_julian_date = int(Tools.get_modified_julian_date())
-            self.create_log_file()
-        with open(self.log_file, "a") as f:
-            self.setpoints = [float(s) for s in self.setpoints]
-            f.write(json.dumps([Tools.get_modified_julian_date(), self.setpoints])+"\n")
+        self.setpoints = [float(s) for s in self.setpoints]
+        self.device_log.write(Clock.CLOCK.tick_mjd, self.setpoints, ["ch1", "ch2", "ch3"])
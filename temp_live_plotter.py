@@ -4,9 +4,9 @@
 import matplotlib.pyplot as plt
 import numpy as np
 import datetime
-import json
 import matplotlib.animation as animation
 import os
+import Log_Reader
 
 # Formating date
 datetime_fmt = '%Y.%m.%d'
@@ -31,8 +31,8 @@ def update_figure():
     # get the data path. 
     today = date_to_mjd(datetime.datetime.today().strftime(datetime_fmt))
     file_path = os.path.dirname(__file__)   
-    file_keithley_1 = os.path.join(file_path, 'Logging/keithley1/'+today+'.txt')
-    file_keithley_2 = os.path.join(file_path, 'Logging/keithley2/'+today+'.txt')
+    file_keithley_1 = os.path.join(file_path, 'Logging/keithley1')
+    file_keithley_2 = os.path.join(file_path, 'Logging/keithley2')
 
     channel_names_1 = ["nc00", "nc01", "nc02", "nc03",
                     "nc04", "nc05", "nc06", "nc07",
@@ -87,18 +87,16 @@ def update_figure():
     ,'Empty']
                     
     # function for loading data in from the temp file
-    def load_temps(path, channels):
+    def load_temps(directory, channels):
         
-        # read data in, each entry is a JSON dict, so we read in a list of JSON dicts
-        data_load = []
-        for line in open(path, 'r'):
-            data_load.append(json.loads(line))
+        # read today's rows of [mjd, temp, temp, ...]; the shared reader only parses what was logged since the last update
+        data_load = Log_Reader.get_reader(directory).read(int(today), int(today) + 1)
         
         # Extract timestamps
-        times = np.transpose([data_load[n][0] for n in range(len(data_load))])
+        times = data_load[:, 0]
         
         # Extract temperatures
-        temp = np.transpose([data_load[n][1] for n in range(len(data_load))])
+        temp = np.transpose(data_load[:, 1:])
         temps = {channels[entry]: temp[entry] for entry in range(40)}
         
         return times, temps
@@ -5,13 +5,15 @@ Created on Thu Feb 06 15:07:30 2020
 @author: Josie Meyer (josephine.meyer@colorado.edu)
 """
 
-import json
 import numpy as np
 import matplotlib.pyplot as plt
 import matplotlib as mpl
 import sys
 import random
-from temp_control import LineTokenizer, Tools, Constants #sister program
+from Line_Tokenizer import LineTokenizer
+from Tools import Tools
+import Constants
+import Log_Reader
 import threading
 import time
 import os
@@ -133,10 +135,11 @@ class Device_Manager():
         device_type: The type of the device, as a string. Currently "keithley",
             "rigol", and "chiller" are supported'''
     def __init__(self, device_name, device_type):
-        self.device_name = device_folder
+        self.device_name = device_name
         self.device_type = device_type
         self.times = []
         self.data = []
+        self.reader = Log_Reader.get_reader(os.path.join("Logging", device_name.replace(" ", "")))
         #set list length for expected data
         if device_type == "keithley" or device_type == "rigol":
             self.num_args = 2 #time, data
@@ -145,7 +148,9 @@ class Device_Manager():
         else:
             raise ValueError("Unrecognized device type")
 
-    '''Reads data from file.
+    '''Reads data from file. The day files are cached by the shared
+    Log_Reader, so repeated calls only parse newly logged entries, and a
+    range crossing midnight reads each day's file.
 
     Params:
         num_days: The number of days of data to attempt to return. May fail
@@ -155,45 +160,17 @@ class Device_Manager():
 
     Returns:
         0) A list of dates/times (as modified julian date)
-        1) A (probably) multidimensional list of data for the device'''
+        1) A list per logged value of its data'''
     def read_data(self, num_days = 1, start_date = None):
-        times_list = []
-        temps_list = []
         if start_date is None:
             start_date = int(Tools.get_modified_julian_date()) + 1 - num_days
-        for i in range(num_days):
-            date = start_date + i
-            times, data = read_data_from_date(i)
-            times_list.append(times)
-            data_list.append(data)
-        self.times = times_list
-        self.data = data_list
+        rows = self.reader.read(start_date, start_date + num_days)
+        if len(rows) == 0:
+            return [], [] #returns nothing if there are no files
+        self.times = rows[:, 0].tolist()
+        self.data = np.transpose(rows[:, 1:]).tolist()
         return self.times, self.data
 
-
-    '''Reads data from a single date.
-
-    Params:
-        date: The modified Julian date to read
-    Returns: see read_data()'''
-    def read_data_from_date(self, date):
-        filename = os.path.join("Logging", self.device_name, str(date)+".txt")
-        try:
-            with open(filename, "r") as f:
-                data = []
-                dates_times = []
-                for encoded_line in f:
-                    line = json.loads(encoded_line) #loads a nested list
-                    if len(line) != self.num_args:
-                        raise ValueError("Incorrect number of arguments in line")
-                    dates_times.append(line[0])
-                    data.append(line[1:])
-        except FileNotFoundError:
-            return [], [] #returns nothing if file does not exist
-        return dates_times, np.transpose(np.array(data)).tolist()
-
-    #TODO implement data caching, deal with midnight
-
 '''Main class for this file. Implements a PyQT5 GUI window for monitoring temps'''
 class Temp_Monitor(QMainWindow):
 
@@ -0,0 +1,58 @@
+from __future__ import division, print_function
+import json
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+import Log_Archiver
+import Log_Format
+import Log_Reader
+
+
+'''Archiving day files left with a partial last row or line by a crash'''
+class Test_Log_Archiver(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    '''Writes a day of 100 entries, then part of one more'''
+    def write_day(self, extension):
+        path = os.path.join(self.directory, "60000" + extension)
+        rows = [[60000 + i/100, float(i), -float(i)] for i in range(100)]
+        if extension == Log_Format.BINARY_EXTENSION:
+            Log_Format.create_binary(path, "dev", "keithley", ["mjd", "a", "b"])
+            with open(path, "ab") as f:
+                f.write(Log_Format.pack_row(rows))
+                f.write(Log_Format.pack_row([60001, 1, 2])[:12])
+        else:
+            with open(path, "wb") as f:
+                for row in rows:
+                    f.write((json.dumps([row[0], row[1:]]) + "\n").encode("utf-8"))
+                f.write(b"[60001.0, [1.0")
+        return path, np.array(rows)
+
+    def check_archive(self, extension):
+        path, rows = self.write_day(extension)
+        compressed_path = Log_Archiver.archive_day(path, frame_size = 256)
+        self.assertFalse(os.path.exists(path))
+        np.testing.assert_array_equal(Log_Format.read_day_file(compressed_path), rows)
+        np.testing.assert_array_equal(Log_Format.read_day_file(compressed_path, 60000.5, 60001), rows[50:])
+        np.testing.assert_array_equal(Log_Reader.Log_Reader(self.directory).read(60000, 60001), rows)
+
+    def test_json_partial_tail(self):
+        self.check_archive(Log_Format.JSON_EXTENSION)
+
+    def test_binary_partial_tail(self):
+        self.check_archive(Log_Format.BINARY_EXTENSION)
+
+    def test_read_plain_json_partial_tail(self):
+        path, rows = self.write_day(Log_Format.JSON_EXTENSION)
+        np.testing.assert_array_equal(Log_Format.read_day_file(path), rows)
+
+
+if __name__ == "__main__":
+    unittest.main()
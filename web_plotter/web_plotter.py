@@ -1,11 +1,14 @@
 import base64
 from io import BytesIO
-from flask import Flask, render_template_string
+from flask import Flask, render_template_string, request
 from matplotlib.figure import Figure
 import numpy as np
 import datetime
-import json
 import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import Log_Pyramid
 
 # Data part
 ## Formating date
@@ -37,8 +40,9 @@ def index():
                         setInterval(function() {
                             var width = $(window).width();
                             var height = $(window).height();
+                            var days = new URLSearchParams(window.location.search).get("days") || 1;
                             $.ajax({
-                                url: "/plot?width=" + width + "&height=" + height,
+                                url: "/plot?width=" + width + "&height=" + height + "&days=" + days,
                                 success: function(data) {
                                     $('#plot').attr('src', 'data:image/png;base64,' + data);
                                 }
@@ -58,9 +62,11 @@ def plot():
 
         # get the data path. 
     today = date_to_mjd(datetime.datetime.today().strftime(datetime_fmt))
+    days = int(request.args.get("days", 1)) # days to plot, ending today (open /?days=30 for a month)
+    pixels = int(request.args.get("width", 1800))
     file_path = os.path.dirname(__file__)   
-    file_keithley_1 = os.path.join(file_path, "..", 'Logging/keithley1/'+today+'.txt')
-    file_keithley_2 = os.path.join(file_path, "..", 'Logging/keithley2/'+today+'.txt')
+    file_keithley_1 = os.path.join(file_path, "..", 'Logging/keithley1')
+    file_keithley_2 = os.path.join(file_path, "..", 'Logging/keithley2')
 
     channel_names_1 = ["nc00", "nc01", "nc02", "nc03",
                     "nc04", "nc05", "nc06", "nc07",
@@ -115,18 +121,17 @@ def plot():
     ,'Empty']
                     
     # function for loading data in from the temp file
-    def load_temps(path, channels):
+    def load_temps(directory, channels):
         
-        # read data in, each entry is a JSON dict, so we read in a list of JSON dicts
-        data_load = []
-        for line in open(path, 'r'):
-            data_load.append(json.loads(line))
+        # read the data in at the resolution the plot needs: every sample for a day,
+        # per-bucket means from the downsampled pyramid for longer ranges
+        data_load = Log_Pyramid.read_range(directory, int(today) + 1 - days, int(today) + 1, pixels)
         
         # Extract timestamps
-        times = np.transpose([data_load[n][0] for n in range(len(data_load))])
+        times = data_load[1]
         
-        # Extract temperatures
-        temp = np.transpose([data_load[n][1] for n in range(len(data_load))])
+        # Extract temperatures (means)
+        temp = np.transpose(data_load[4])
         temps = {channels[entry]: temp[entry] for entry in range(40)}
         
         return times, temps